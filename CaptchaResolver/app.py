@@ -2,7 +2,7 @@ import logging
 import os.path
 
 import waitress as waitress
-from flask import Flask, request, render_template
+from flask import Flask, Response, request, render_template
 
 if os.path.exists('app.log'):
     os.remove('app.log')
@@ -21,9 +21,18 @@ logger.addHandler(file_handler)
 logger.propagate = True
 
 logger.info("Loading solutions...")
-from intercept import intercept
-logger.info("Everything is ready")
+from solutions.tools.common import metrics
+from solutions.tools.common.admission import AdmissionQueue, Expired, Overloaded
+from solutions.tools.common.assets import MissingAssetsError, manager as asset_manager
+try:
+    from intercept import intercept
+    logger.info("Everything is ready")
+except MissingAssetsError as e:
+    # Keep serving so that /ready reports which assets are missing
+    intercept = None
+    logger.error(f"Resolver is not ready: {e}, run `python -m pull_assets pull` or set RESOLVER_ASSET_MIRROR")
 
+admission = AdmissionQueue()
 
 app = Flask(__name__)
 
@@ -42,20 +51,48 @@ def captcha_resolver():
         recaptcha: {'type': 'recaptcha', 'images': b64_imgs, 'label': 'bus', grid: '1x1 or 3x3 or 4x4'}
         antibot: {'type': 'antibot', 'images': b64_imgs}
         viefaucet: {'type': 'vie_antibot', 'images': b64_imgs}
+    Headers X-Resolver-Budget (seconds) or X-Resolver-Deadline (unix time) set the time left to answer, requests that
+    cannot be answered in time get 503 with error Overloaded or Expired
     :return: thread id
     """
 
-    data = request.json
+    if intercept is None:
+        return {'error': 'NotReady', 'assets': asset_manager.status()}, 503
+    with metrics.span('parse_json'):
+        data = request.json
     vdata = data.copy()
     if vdata.get('image') is not None:
         vdata['image'] = '<b64_image>'
     else:
         vdata['images'] = '<b64_images>'
     logger.info(f"[Resolver] {vdata}")
-    results = intercept(data)
+    try:
+        results = admission.run(intercept, data, deadline=admission.deadline(request.headers),
+                                kind=f"{data.get('type')}/{data.get('grid', '-')}")
+    except Overloaded:
+        return {'response': False, 'error': 'Overloaded'}, 503
+    except Expired:
+        return {'response': False, 'error': 'Expired'}, 503
     return results
 
 
+@app.route('/ready')
+def ready():
+    """
+    Status of every asset and requests waiting in the admission queue, 503 until all assets are available and the
+    solutions are loaded
+    """
+    ok = intercept is not None and asset_manager.ready
+    return {'ready': ok, 'assets': asset_manager.status(), 'queue_depth': admission.depth}, 200 if ok else 503
+
+
+@app.route('/metrics')
+def metrics_page():
+    """Per stage latency histograms, in-flight requests, model load times and cache lookups in prometheus format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
     logger.info("Serving on http://127.0.0.1:5000")
-    waitress.serve(app, listen='0.0.0.0:5000')
+    # Threads only wait on the admission queue, inference runs on its RESOLVER_WORKERS workers
+    waitress.serve(app, listen='0.0.0.0:5000', threads=int(os.environ.get('RESOLVER_THREADS', 32)))
@@ -0,0 +1,181 @@
+"""
+ASGI front end of the resolver served by uvicorn, same endpoints and /resolve contract as app.py
+
+Requests are resolved by the admission queue workers (see solutions.tools.common.admission), the event loop only reads
+bodies and answers, so /, /ready and /metrics stay responsive while every worker is busy with inference
+Usage::
+    python -m asgi
+    python -m asgi --port 5000 --workers 4 --max-body-mb 20 --timeout 30
+    uvicorn asgi:app --port 5000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, Response
+from starlette.routing import Route
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+
+logger.info("Loading solutions...")
+from solutions.tools.common import metrics
+from solutions.tools.common.admission import WORKERS, AdmissionQueue, Expired, Overloaded
+from solutions.tools.common.assets import MissingAssetsError, manager as asset_manager
+try:
+    from intercept import intercept
+    logger.info("Everything is ready")
+except MissingAssetsError as e:
+    intercept = None
+    logger.error(f"Resolver is not ready: {e}, run `python -m pull_assets pull` or set RESOLVER_ASSET_MIRROR")
+
+MAX_BODY_SIZE = int(float(os.environ.get('RESOLVER_MAX_BODY_MB', 20)) * 1024 * 1024)
+REQUEST_TIMEOUT = float(os.environ.get('RESOLVER_TIMEOUT', 30))
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+async def read_body(request, limit):
+    """ Read request body, stop as soon as it exceeds limit bytes """
+    length = request.headers.get('content-length')
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise PayloadTooLarge
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise PayloadTooLarge
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def parse(body):
+    """ Runs on the default executor so that large bodies do not block the event loop """
+    with metrics.span('parse_json'):
+        data = json.loads(body)
+    vdata = data.copy()
+    if vdata.get('image') is not None:
+        vdata['image'] = '<b64_image>'
+    else:
+        vdata['images'] = '<b64_images>'
+    logger.info(f"[Resolver] {vdata}")
+    return data
+
+
+async def index(request):
+    logger.info("Index page")
+    with open(os.path.join(TEMPLATE_DIR, 'index.html'), 'r') as f:
+        return HTMLResponse(f.read())
+
+
+async def captcha_resolver(request):
+    """
+    Same payloads and deadline headers as app.captcha_resolver
+    Responds 413 if body exceeds max body size, 503 if it cannot be resolved before its deadline, 504 if request is
+    not resolved within timeout
+    """
+
+    if intercept is None:
+        return JSONResponse({'error': 'NotReady', 'assets': asset_manager.status()}, status_code=503)
+    try:
+        body = await read_body(request, request.app.state.max_body_size)
+    except PayloadTooLarge:
+        return JSONResponse({'error': 'PayloadTooLarge'}, status_code=413)
+
+    admission = request.app.state.admission
+    deadline = admission.deadline(request.headers)
+    try:
+        data = await asyncio.get_running_loop().run_in_executor(None, parse, body)
+        future = admission.submit(intercept, data, deadline=deadline, kind=f"{data.get('type')}/{data.get('grid', '-')}")
+        results = await asyncio.wait_for(asyncio.wrap_future(future), request.app.state.timeout)
+    except json.JSONDecodeError:
+        return JSONResponse({'error': 'InvalidJSON'}, status_code=400)
+    except Overloaded:
+        return JSONResponse({'response': False, 'error': 'Overloaded'}, status_code=503)
+    except Expired:
+        return JSONResponse({'response': False, 'error': 'Expired'}, status_code=503)
+    except asyncio.TimeoutError:
+        # A running request is finished by its worker in background, its result is discarded
+        logger.warning(f"[Resolver] Request timed out after {request.app.state.timeout}s")
+        return JSONResponse({'error': 'Timeout'}, status_code=504)
+    return JSONResponse(results)
+
+
+async def ready(request):
+    """
+    Status of every asset and requests waiting in the admission queue, 503 until all assets are available and the
+    solutions are loaded
+    """
+    ok = intercept is not None and asset_manager.ready
+    status = {'ready': ok, 'assets': asset_manager.status(), 'queue_depth': request.app.state.admission.depth}
+    return JSONResponse(status, status_code=200 if ok else 503)
+
+
+async def metrics_page(request):
+    """Per stage latency histograms, in-flight requests, model load times and cache lookups in prometheus format"""
+    return Response(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+def create_app(workers=WORKERS, max_body_size=MAX_BODY_SIZE, timeout=REQUEST_TIMEOUT):
+    """
+    :param workers: admission queue workers resolving requests
+    :param max_body_size: max request body in bytes
+    :param timeout: seconds before a request is answered with 504
+    """
+
+    app = Starlette(routes=[
+        Route('/', index),
+        Route('/resolve', captcha_resolver, methods=['POST', 'GET']),
+        Route('/ready', ready),
+        Route('/metrics', metrics_page),
+    ])
+    app.state.admission = AdmissionQueue(workers)
+    app.state.max_body_size = max_body_size
+    app.state.timeout = timeout
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    """ Module attribute app, created with default settings on first access so that main builds the only one """
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the resolver with uvicorn")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', default=5000, type=int)
+    parser.add_argument('-w', '--workers', default=WORKERS, type=int, help="threads resolving requests")
+    parser.add_argument('--max-body-mb', default=MAX_BODY_SIZE / 1024 / 1024, type=float, help="max request body")
+    parser.add_argument('--timeout', default=REQUEST_TIMEOUT, type=float, help="seconds before answering 504")
+    parser.add_argument('--limit-concurrency', default=None, type=int,
+                        help="max connections, further ones are answered 503 by uvicorn")
+    args = parser.parse_args()
+
+    global _app
+    _app = create_app(args.workers, int(args.max_body_mb * 1024 * 1024), args.timeout)
+    logger.info(f"Serving on http://{args.host}:{args.port}")
+    uvicorn.run(_app, host=args.host, port=args.port, limit_concurrency=args.limit_concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Replay captured resolver requests to benchmark the resolver
+
+Captures are the request data saved by the debugger in `debugger/json`, they can be packed into a memory-mapped corpus
+Usage::
+    python -m benchmark pack debugger/json corpus/captures
+    python -m benchmark run debugger/json -c 4 -o results.json
+    python -m benchmark run corpus/captures.idx --url http://127.0.0.1:5000 -c 16 --rate 20
+    python -m benchmark compare old_results.json new_results.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from solutions.tools.common.pack import Corpus, PackWriter, load_captures
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+PERCENTILES = (50, 95, 99)
+
+
+def peak_rss(pid=None):
+    """
+    Peak resident memory in MB of given process or of this process
+    :return: float or None if it cannot be measured on this platform
+    """
+
+    if pid is not None:
+        try:
+            with open(f"/proc/{pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    """ Current commit of the tree, so that results can be matched with the code they measured """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def group_of(data):
+    """ Results are grouped by captcha type and grid """
+    return f"{data.get('type')}/{data.get('grid', '-')}"
+
+
+def summarize(values):
+    """ Latency summary in milliseconds """
+    values = np.array(values) * 1000
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary['mean'] = round(float(values.mean()), 3)
+    summary['max'] = round(float(values.max()), 3)
+    return summary
+
+
+class Replayer:
+    """Replay corpus against intercept() in-process or against a running /resolve"""
+
+    def __init__(self, corpus, url=None, concurrency=1, rate=None, repeat=1, warmup=0, seed=0):
+        """
+        :param corpus: Corpus or list of request data
+        :param url: resolver address like http://127.0.0.1:5000, in-process intercept() if None
+        :param concurrency: max number of requests in flight
+        :param rate: mean arrival rate in requests/second (poisson arrivals), as fast as possible if None
+        :param repeat: replay corpus n times
+        :param warmup: number of requests to send before measuring
+        :param seed: seed of arrival process
+        """
+
+        self.corpus = corpus
+        self.url = url
+        self.concurrency = concurrency
+        self.rate = rate
+        self.repeat = repeat
+        self.warmup = warmup
+        self.random = random.Random(seed)
+        self.session = None
+        self.resolve = self._resolve_http if url is not None else self._resolve_inproc
+        self._lock = threading.Lock()
+        self._in_flight = threading.Semaphore(concurrency)
+        self._stages_before = {}
+        self.samples = []
+
+    def _resolve_inproc(self, data):
+        from intercept import intercept
+        return intercept(data, debugger=False)
+
+    def _resolve_http(self, data):
+        response = self.session.post(f"{self.url}/resolve", json=data)
+        response.raise_for_status()
+        return response.json()
+
+    def _job(self, data, scheduled_at):
+        started_at = time.perf_counter()
+        error = None
+        try:
+            self.resolve(data)
+        except Exception as e:
+            error = type(e).__name__
+        finished_at = time.perf_counter()
+        self._in_flight.release()
+        with self._lock:
+            self.samples.append({
+                'group': group_of(data),
+                'latency': finished_at - scheduled_at,
+                'stages': {'queue': started_at - scheduled_at, 'service': finished_at - started_at},
+                'error': error,
+            })
+
+    def prepare(self):
+        if self.url is not None:
+            import requests
+            self.session = requests.Session()
+            self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=self.concurrency))
+        else:
+            logger.info("Loading solutions...")
+            from intercept import intercept  # noqa
+
+        for i in range(min(self.warmup, len(self.corpus))):
+            self.resolve(self.corpus[i])
+        self._stages_before = self.resolver_stages()
+
+    def resolver_stages(self):
+        """
+        Time spent in each resolver stage (decode, split, forward, ...) as reported by resolver metrics
+        Only available in-process, scrape /metrics of the resolver otherwise
+        :return: {(group, stage): [seconds, count]}
+        """
+
+        if self.url is not None:
+            return {}
+        from solutions.tools.common import metrics
+        stages = defaultdict(lambda: [0.0, 0])
+        for labels, (seconds, count) in metrics.REGISTRY.snapshot('resolver_stage_seconds').items():
+            labels = dict(labels)
+            key = (f"{labels['type'] or None}/{labels['grid'] or '-'}", labels['stage'])
+            stages[key][0] += seconds
+            stages[key][1] += count
+        return stages
+
+    def run(self):
+        """
+        Replay the corpus
+        :return: machine-readable results
+        """
+
+        self.prepare()
+        n = len(self.corpus) * self.repeat
+        logger.info(f"Replaying {n} requests | concurrency: {self.concurrency} | rate: {self.rate or 'max'}")
+        start_time = time.perf_counter()
+        next_arrival = start_time
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for i in range(n):
+                data = self.corpus[i % len(self.corpus)]
+                if self.rate:
+                    # Open loop: requests arrive on schedule, waiting for a free slot is part of their latency
+                    next_arrival += self.random.expovariate(self.rate)
+                    time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                    scheduled_at = time.perf_counter()
+                    self._in_flight.acquire()
+                else:
+                    # Closed loop: next request is sent as soon as a slot is free
+                    self._in_flight.acquire()
+                    scheduled_at = time.perf_counter()
+                executor.submit(self._job, data, scheduled_at)
+        duration = time.perf_counter() - start_time
+        return self.results(duration)
+
+    def results(self, duration):
+        groups = defaultdict(list)
+        for sample in self.samples:
+            groups[sample['group']].append(sample)
+
+        resolver_stages = defaultdict(dict)
+        for (group, stage), (seconds, count) in self.resolver_stages().items():
+            seconds_before, count_before = self._stages_before.get((group, stage), (0.0, 0))
+            if count > count_before:
+                resolver_stages[group][stage] = round((seconds - seconds_before) / (count - count_before) * 1000, 3)
+
+        summary = {}
+        for group, samples in sorted(groups.items()):
+            ok = [s for s in samples if s['error'] is None] or samples
+            summary[group] = {
+                'count': len(samples),
+                'errors': len(samples) - len([s for s in samples if s['error'] is None]),
+                'latency_ms': summarize([s['latency'] for s in ok]),
+                'stages_ms': {stage: summarize([s['stages'][stage] for s in ok]) for stage in ok[0]['stages']},
+                'resolver_stages_mean_ms': resolver_stages.get(group, {}),
+            }
+
+        return {
+            'commit': git_commit(),
+            'mode': 'http' if self.url is not None else 'inproc',
+            'url': self.url,
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'requests': len(self.samples),
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(self.samples) / duration, 3) if duration else None,
+            'latency_ms': summarize([s['latency'] for s in self.samples]) if self.samples else None,
+            'groups': summary,
+        }
+
+
+def compare(old, new):
+    """ Print latency deltas of new results against old results per group """
+    print(f"{'group':<20}{'metric':<8}{'old':>12}{'new':>12}{'delta %':>10}")
+    for group in sorted(set(old['groups']) | set(new['groups'])):
+        o, n = old['groups'].get(group), new['groups'].get(group)
+        if o is None or n is None:
+            print(f"{group:<20}only in {'new' if o is None else 'old'} results")
+            continue
+        for metric in [f'p{p}' for p in PERCENTILES]:
+            ov, nv = o['latency_ms'][metric], n['latency_ms'][metric]
+            delta = (nv - ov) / ov * 100 if ov else 0
+            print(f"{group:<20}{metric:<8}{ov:>12.1f}{nv:>12.1f}{delta:>+10.1f}")
+    print(f"{'throughput':<28}{old['throughput_rps']:>12.2f}{new['throughput_rps']:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay debugger captures against the resolver")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = sub.add_parser('pack', help="Pack a captures directory into a memory-mapped corpus")
+    pack_parser.add_argument('captures', help="captures directory, i.e: debugger/json")
+    pack_parser.add_argument('output', help="corpus path without extension")
+
+    run_parser = sub.add_parser('run', help="Replay corpus and report latencies")
+    run_parser.add_argument('corpus', help="captures directory, packs directory or <corpus>.idx")
+    run_parser.add_argument('-u', '--url', default=None, help="resolver address, replay in-process if not given")
+    run_parser.add_argument('-c', '--concurrency', default=1, type=int, help="max requests in flight")
+    run_parser.add_argument('-r', '--rate', default=None, type=float, help="arrival rate in requests/second")
+    run_parser.add_argument('-n', '--repeat', default=1, type=int, help="replay corpus n times")
+    run_parser.add_argument('-w', '--warmup', default=0, type=int, help="requests sent before measuring")
+    run_parser.add_argument('--server-pid', default=None, type=int, help="pid of resolver to report its peak RSS")
+    run_parser.add_argument('-o', '--output', default=None, help="write results as json")
+
+    compare_parser = sub.add_parser('compare', help="Compare two results files")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        with PackWriter(args.output) as writer:
+            for data in load_captures(args.captures):
+                writer.append(data)
+        logger.info(f"Packed {writer.count} requests in {args.output}")
+    elif args.command == 'run':
+        corpus = Corpus(args.corpus)
+        if not len(corpus):
+            raise SystemExit(f"No requests found in {args.corpus}")
+        results = Replayer(corpus, args.url, args.concurrency, args.rate, args.repeat, args.warmup).run()
+        results['peak_rss_mb'] = peak_rss(args.server_pid if args.url is not None else None)
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                f.write(output)
+        print(output)
+    else:
+        with open(args.old, 'r') as o, open(args.new, 'r') as n:
+            compare(json.load(o), json.load(n))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler()])
+    main()
@@ -0,0 +1,271 @@
+"""
+Build ONNX, OpenVINO and INT8 variants of the reCAPTCHA YOLO models and choose which variant Detector loads
+
+Calibration and evaluation images are drawn from the debugger captures, every variant is compared against the original
+FP32 PyTorch model on a held-out set and the results are written to the manifest (solutions/recaptcha/assets/manifest.yaml)
+Usage::
+    python -m build_models build debugger/packs
+    python -m build_models build debugger/packs --models re-detector-v1 stair-seg --variants onnx-fp32 int8-static
+    python -m build_models build debugger/packs --select --max-f1-drop 0.02
+    python -m build_models select re-detector-v1 int8-dynamic
+    python -m build_models select re-detector-v1 pt
+"""
+
+import argparse
+import glob
+import logging
+import os
+import random
+import shutil
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+from solutions.tools.common.pack import Corpus
+from solutions.tools.pre_processing import pconversion, pimage, plist
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), 'solutions', 'recaptcha', 'assets')
+MODEL_DIR = os.path.join(ASSETS_DIR, 'models')
+BUILD_DIR = os.path.join(ASSETS_DIR, 'builds')
+MANIFEST_PATH = os.path.join(ASSETS_DIR, 'manifest.yaml')
+VARIANTS = ('onnx-fp32', 'openvino-fp32', 'int8-dynamic', 'int8-static')
+IMGSZ = 640
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {'models': {}, 'variants': {}}
+    with open(MANIFEST_PATH, 'r') as f:
+        manifest = yaml.safe_load(f) or {}
+    manifest.setdefault('models', {})
+    manifest.setdefault('variants', {})
+    return manifest
+
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH, 'w') as f:
+        f.write("# Variant of each model loaded by Detector, models not listed here are loaded from their .pt file\n"
+                "# Written by `python -m build_models`, variants hold the measured accuracy and latency of each build\n")
+        yaml.safe_dump(manifest, f, sort_keys=True)
+
+
+def letterbox(img, size=IMGSZ):
+    """ Resize keeping aspect ratio and pad to size x size like YOLO preprocessing, return NCHW float32 in 0-1 """
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255
+    return np.ascontiguousarray(blob)
+
+
+def load_images(corpus_path):
+    """
+    Images as the resolver feeds them to the models
+    :return: {'detect': 3x3 tiles and 1x1 images, 'segment': 4x4 images}
+    """
+
+    images = {'detect': [], 'segment': []}
+    for data in Corpus(corpus_path):
+        if data.get('type') != 'recaptcha':
+            continue
+        b64_images = data['images'] if data.get('images') is not None else [data['image']]
+        imgs = [pconversion.base64_to_bgr(img) for img in b64_images]
+        if data.get('grid') == '3x3':
+            tiles = plist.transpose(pimage.split(imgs[0], structure=(3, 3)))
+            images['detect'].extend(sum(tiles, []))
+        elif data.get('grid') == '4x4':
+            images['segment'].extend(imgs)
+        else:
+            images['detect'].extend(imgs)
+    return images
+
+
+class CalibrationReader:
+    """ onnxruntime CalibrationDataReader over calibration images """
+
+    def __init__(self, input_name, images):
+        self.input_name = input_name
+        self.images = iter(images)
+
+    def get_next(self):
+        img = next(self.images, None)
+        return None if img is None else {self.input_name: letterbox(img)}
+
+
+def export_onnx(pt_path, name):
+    """ Export FP32 ONNX with dynamic input size next to the other builds """
+    from ultralytics import YOLO
+    exported = YOLO(pt_path).export(format='onnx', dynamic=True, simplify=True, imgsz=IMGSZ)
+    path = os.path.join(BUILD_DIR, f"{name}.onnx-fp32.onnx")
+    shutil.move(exported, path)
+    return path
+
+
+def export_openvino(pt_path, name):
+    """ Export FP32 OpenVINO model, ultralytics recognizes it by its _openvino_model suffix """
+    from ultralytics import YOLO
+    exported = YOLO(pt_path).export(format='openvino', imgsz=IMGSZ)
+    path = os.path.join(BUILD_DIR, f"{name}.openvino-fp32_openvino_model")
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    shutil.move(exported, path)
+    return path
+
+
+def quantize(fp32_path, name, variant, calibration):
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    path = os.path.join(BUILD_DIR, f"{name}.{variant}.onnx")
+    if variant == 'int8-dynamic':
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    else:
+        input_name = InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+        quantize_static(fp32_path, path, CalibrationReader(input_name, calibration), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    return path
+
+
+def iou(a, b):
+    x1, y1, x2, y2 = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0
+
+
+def detections(model, img, conf):
+    result = model.predict(img, conf=conf, verbose=False)[0]
+    return [(int(c), [float(x) for x in box]) for c, box in zip(result.boxes.cls, result.boxes.xyxy)]
+
+
+def agreement(reference, candidate, threshold=0.5):
+    """ F1 of candidate detections against reference detections, same class and IoU >= threshold is a match """
+    if not reference and not candidate:
+        return 1.0
+    unmatched = list(reference)
+    tp = 0
+    for cls, box in candidate:
+        match = next((r for r in unmatched if r[0] == cls and iou(r[1], box) >= threshold), None)
+        if match is not None:
+            unmatched.remove(match)
+            tp += 1
+    return 2 * tp / (len(reference) + len(candidate))
+
+
+def evaluate(reference, candidate, images, conf=0.25):
+    """ Mean agreement of candidate with reference and mean latency of both in milliseconds """
+    scores, ref_times, cand_times = [], [], []
+    for img in images:
+        start_time = time.perf_counter()
+        ref = detections(reference, img, conf)
+        ref_times.append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        cand = detections(candidate, img, conf)
+        cand_times.append(time.perf_counter() - start_time)
+        scores.append(agreement(ref, cand))
+    return {
+        'f1_vs_fp32': round(float(np.mean(scores)), 4) if scores else None,
+        'latency_ms': round(float(np.mean(cand_times)) * 1000, 3) if cand_times else None,
+        'fp32_latency_ms': round(float(np.mean(ref_times)) * 1000, 3) if ref_times else None,
+        'images': len(images),
+    }
+
+
+def build(corpus_path, models=None, variants=VARIANTS, holdout=0.3, max_calibration=200, select=False,
+          max_f1_drop=0.02, seed=0):
+    from ultralytics import YOLO
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    manifest = load_manifest()
+    images = load_images(corpus_path)
+    for key in images:
+        random.Random(seed).shuffle(images[key])
+        logger.info(f"{len(images[key])} {key} images found in {corpus_path}")
+
+    for pt_path in sorted(glob.glob(os.path.join(MODEL_DIR, '*.pt'))):
+        name = os.path.basename(pt_path).removesuffix('.pt')
+        if models and name not in models:
+            continue
+        reference = YOLO(pt_path)
+        task = reference.task
+        pool = images.get(task) or images['detect'] + images['segment']
+        n_holdout = int(len(pool) * holdout)
+        held_out, calibration = pool[:n_holdout], pool[n_holdout:][:max_calibration]
+        logger.info(f"[{name}] task: {task} | calibration: {len(calibration)} | held-out: {len(held_out)}")
+
+        fp32_path = export_onnx(pt_path, name)
+        report = manifest['variants'].setdefault(name, {})
+        for variant in variants:
+            if variant == 'int8-static' and not calibration:
+                logger.warning(f"[{name}] No calibration images, skipping {variant}")
+                continue
+            if variant == 'onnx-fp32':
+                path = fp32_path
+            elif variant == 'openvino-fp32':
+                path = export_openvino(pt_path, name)
+            else:
+                path = quantize(fp32_path, name, variant, calibration)
+            metrics = evaluate(reference, YOLO(path, task=task), held_out)
+            report[variant] = {'path': os.path.relpath(path, ASSETS_DIR), 'task': task, **metrics}
+            logger.info(f"[{name}] {variant}: {metrics}")
+
+        if select:
+            # Fastest variant within accuracy budget
+            candidates = [(v['latency_ms'], k) for k, v in report.items() if v.get('latency_ms') is not None and
+                          v.get('f1_vs_fp32') is not None and v['f1_vs_fp32'] >= 1 - max_f1_drop]
+            if candidates:
+                choose(manifest, name, min(candidates)[1])
+        save_manifest(manifest)
+    return manifest
+
+
+def choose(manifest, name, variant):
+    """ Make Detector load given variant of model, `pt` means original PyTorch model """
+    if variant == 'pt':
+        manifest['models'].pop(name, None)
+    else:
+        entry = manifest['variants'].get(name, {}).get(variant)
+        if entry is None:
+            raise SystemExit(f"{name} has no {variant} build, run `python -m build_models build` first")
+        fmt = 'openvino' if variant.startswith('openvino') else 'onnx'
+        manifest['models'][name] = {'format': fmt, 'variant': variant, 'path': entry['path'], 'task': entry['task']}
+    logger.info(f"[{name}] Detector will load {variant}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build ONNX/INT8 variants of reCAPTCHA models")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = sub.add_parser('build', help="Export, quantize and evaluate models")
+    build_parser.add_argument('corpus', help="captures directory, packs directory or <corpus>.idx")
+    build_parser.add_argument('--models', nargs='*', default=None, help="model names, all models if not given")
+    build_parser.add_argument('--variants', nargs='*', default=VARIANTS, choices=VARIANTS)
+    build_parser.add_argument('--holdout', default=0.3, type=float, help="fraction of images held out for evaluation")
+    build_parser.add_argument('--max-calibration', default=200, type=int, help="max calibration images per model")
+    build_parser.add_argument('--select', action='store_true', help="select fastest variant within accuracy budget")
+    build_parser.add_argument('--max-f1-drop', default=0.02, type=float, help="accuracy budget of --select")
+
+    select_parser = sub.add_parser('select', help="Choose variant loaded by Detector")
+    select_parser.add_argument('model')
+    select_parser.add_argument('variant', choices=('pt',) + VARIANTS)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build(args.corpus, args.models, args.variants, args.holdout, args.max_calibration, args.select, args.max_f1_drop)
+    else:
+        manifest = load_manifest()
+        choose(manifest, args.model, args.variant)
+        save_manifest(manifest)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler()])
+    main()
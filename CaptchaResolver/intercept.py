@@ -1,21 +1,30 @@
-import json
+import atexit
+import hashlib
 import logging
 import os
 import time
-import uuid
 from datetime import datetime
 
-import cv2
 import yaml
 
 from solutions.antibot.inference import predict as antibot_predictor
-from solutions.hcaptcha.inference import predict as hcaptcha_predictor
-from solutions.recaptcha.inference import predict as recaptcha_predictor
+from solutions.hcaptcha.inference import predict as hcaptcha_predictor, label_map as hcaptcha_label_map
+from solutions.hcaptcha.label_tools import split_prompt_message, label_cleaning
+from solutions.recaptcha.api import label_manager as recaptcha_label_manager
+from solutions.recaptcha.inference import predict as recaptcha_predictor, choose_tier as recaptcha_tier
+from solutions.tools.common import metrics
+from solutions.tools.common.admission import current_deadline
+from solutions.tools.common.capture import CaptureWriter
+from solutions.tools.common.singleflight import SingleFlight
 from solutions.tools.pre_processing import pconversion
 
 logger = logging.getLogger(__name__)
-with open('track.yaml', 'r') as tracker:
+with open(os.path.join(os.path.dirname(__file__), 'track.yaml'), 'r') as tracker:
     objects_to_track = yaml.safe_load(tracker)
+capture_writer = CaptureWriter(os.path.join(os.path.dirname(__file__), "debugger", "packs"),
+                               **(objects_to_track.get('Writer') or {}))
+atexit.register(capture_writer.close)
+coalescer = SingleFlight(**(objects_to_track.get('Coalescing') or {}))
 
 
 def intercept(data, debugger=True):
@@ -25,41 +34,78 @@ def intercept(data, debugger=True):
         type: hcaptcha or antibot or viefaucet or recaptcha
         prompt: if hcaptcha or recaptcha(send label)
         images: base64 images
-    :param debugger: true if you want to save unsolved images for later processing else false
+    :param debugger: true if you want to save unsolved images for later processing else false, they are written in
+                     background to debugger/packs
     :return: predictions
     """
 
     start_time = time.time()
+    with metrics.request_context(type=data['type'], grid=data.get('grid'), label=_metric_label(data)), \
+            metrics.span('total'):
+        results = _intercept(data, debugger)
+
+    end_time = time.time()
+    logger.info(f"Time-Consumption: {round(end_time - start_time, 2)} | Response: {results}")
+    return results
+
+
+def _metric_label(data):
+    """ Label of request metrics, labels that are not solved are recorded as other to keep metric series bounded """
+    if data['type'] == 'hcaptcha' and data.get('prompt'):
+        label = label_cleaning(split_prompt_message(data['prompt']))
+        return label if label in hcaptcha_label_map.map else 'other'
+    if data['type'] == 'recaptcha' and data.get('label'):
+        label = recaptcha_label_manager.clean_label(data['label'])
+        return label if label in recaptcha_label_manager.objects else 'other'
+    return None
+
+
+def _coalesce(data, images, fn):
+    """
+    Share result of fn() with identical requests in flight, keyed by type, label, grid and decoded images
+    Followers wait at most until the deadline of their request, then fail with Expired
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    for img in images:
+        digest.update(img.tobytes())
+    key = (data['type'], data.get('label') or data.get('prompt'), data.get('grid'), digest.hexdigest())
+    return coalescer.do(key, fn, deadline=current_deadline())
+
+
+def _intercept(data, debugger):
     results = {}
     if data['type'] == 'antibot':
-        images = [pconversion.base64_to_cv2(b64_str) for b64_str in data['images']]
-        results['response'] = antibot_predictor(images)
+        with metrics.span('decode'):
+            images = [pconversion.base64_to_cv2(b64_str) for b64_str in data['images']]
+        results['response'] = _coalesce(data, images, lambda: antibot_predictor(images))
     elif data['type'] == 'hcaptcha':
-        imgs = [pconversion.base64_to_pil(img) for img in data['images']]
-        results['response'] = hcaptcha_predictor(data['prompt'], imgs)
+        with metrics.span('decode'):
+            imgs = [pconversion.base64_to_pil(img) for img in data['images']]
+        results['response'] = _coalesce(data, imgs, lambda: hcaptcha_predictor(data['prompt'], imgs))
     elif data['type'] == 'recaptcha':
-        if data.get('images') is not None:
-            imgs = [cv2.cvtColor(pconversion.base64_to_cv2(img), cv2.COLOR_RGBA2BGR) for img in data['images']]
-        else:
-            imgs = cv2.cvtColor(pconversion.base64_to_cv2(data['image']), cv2.COLOR_RGBA2BGR)
+        with metrics.span('decode'):
+            if data.get('images') is not None:
+                imgs = [pconversion.base64_to_bgr(img) for img in data['images']]
+            else:
+                imgs = pconversion.base64_to_bgr(data['image'])
 
-        results['response'] = recaptcha_predictor(imgs, data['label'], data['grid'])
+        def solve():
+            tier = recaptcha_tier(data['label'], data['grid'])
+            return recaptcha_predictor(imgs, data['label'], data['grid'], tier=tier), tier
+
+        response, tier = _coalesce(data, imgs if isinstance(imgs, list) else [imgs], solve)
+        results['response'] = response
+        if tier is not None:
+            results['tier'] = tier['name']
     else:
         results['response'] = 'InvalidCaptchaType'
 
     if debugger:
         if not results['response'] or data.get('label') in objects_to_track['Objects']:
-            storage_path = os.path.join(os.path.dirname(__file__), "debugger", "json")
-            os.makedirs(storage_path, exist_ok=True)
-            data['datetime'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            if data['type'] == 'recaptcha':
-                json_path = os.path.join(storage_path, f"{data['type']}-{data['label']}-{uuid.uuid4()}.json")
-            else:
-                json_path = os.path.join(storage_path, f"{data['type']}-{uuid.uuid4()}.json")
-            with open(json_path, 'w') as file:
-                json.dump(data, file)
-            logger.info(f"Data is saved in {json_path}")
+            with metrics.span('debugger'):
+                data['datetime'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                if capture_writer.submit(data):
+                    logger.info(f"Data is queued for {capture_writer.directory}")
 
-    end_time = time.time()
-    logger.info(f"Time-Consumption: {round(end_time - start_time, 2)} | Response: {results}")
     return results
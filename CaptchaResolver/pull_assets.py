@@ -0,0 +1,60 @@
+"""
+Fetch, verify and lock the assets listed in assets.yaml
+
+Usage::
+    python -m pull_assets pull
+    python -m pull_assets pull --mirror /srv/captchaxpert-assets
+    python -m pull_assets status
+    python -m pull_assets lock
+"""
+
+import argparse
+import logging
+import os
+
+from solutions.tools.common.assets import AssetManager, MissingAssetsError
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage assets of the resolver")
+    parser.add_argument('--mirror', default=None, help="local directory holding assets as <tag>/<name> or <name>")
+    parser.add_argument('--offline', action='store_true', help="never touch the network, copy assets from mirror")
+    parser.add_argument('-w', '--workers', default=4, type=int, help="parallel downloads")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    pull_parser = sub.add_parser('pull', help="Fetch missing assets")
+    pull_parser.add_argument('names', nargs='*', help="asset names, all assets if not given")
+    pull_parser.add_argument('--update', action='store_true', help="fetch assets again even if present")
+    sub.add_parser('status', help="Report assets which are missing or do not match manifest")
+    lock_parser = sub.add_parser('lock', help="Write size and sha256 of local assets in manifest")
+    lock_parser.add_argument('names', nargs='*', help="asset names, all assets if not given")
+    args = parser.parse_args()
+
+    manager = AssetManager(mirror=args.mirror, offline=args.offline or None, workers=args.workers)
+    if args.command == 'pull':
+        try:
+            manager.ensure(args.names or list(manager.assets), update=args.update)
+        except MissingAssetsError as e:
+            raise SystemExit(str(e))
+        logger.info("Every asset is available")
+    elif args.command == 'status':
+        for name in manager.assets:
+            path = manager.path(name)
+            if not os.path.exists(path):
+                status = 'missing'
+            elif not manager.pinned(name):
+                status = 'unpinned'
+            else:
+                status = 'ok' if manager.verify(name, path) else 'checksum mismatch'
+            print(f"{name:<24}{status:<20}{path}")
+    else:
+        manager.lock(args.names)
+        logger.info(f"Locked assets in {manager.manifest_path}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler()])
+    main()
@@ -1,17 +1,21 @@
 from ..tools.pre_processing import plist, pimage
-from ..tools.common.pull import pull_asset
+from ..tools.common import backends, metrics
+from ..tools.common.assets import manager as asset_manager
 import os.path
+import time
 
 import cv2
 import numpy as np
-import onnxruntime
 
-release_tag = 'v3.0'
 model_name = 'antibot.onnx'
 model_path = os.path.join(os.path.dirname(__file__), 'assets', model_name)
-if not os.path.exists(model_path):
-    pull_asset(release_tag, model_name, os.path.dirname(model_path))
-model = onnxruntime.InferenceSession(model_path)
+asset_manager.ensure([model_name], {model_name: os.path.dirname(model_path)})
+_start_time = time.perf_counter()
+backend, model = backends.selector.select(
+    'antibot', {b: lambda b=b: backends.OnnxRunner(model_path, b) for b in ('onnxruntime', 'openvino')},
+    default='onnxruntime', inputs=lambda: [np.zeros((1, 40, 40, 3), dtype=np.float32)] * 4,
+    run=lambda m, x: m.run({m.input_names[0]: x}))
+metrics.model_loaded(model_name, time.perf_counter() - _start_time)
 class_names = ['1', '10', '11', '2', '3', '4', '5', '6', '7', '8', '9', 'ant', 'cat', 'cow', 'dog',
                'elephant', 'fox', 'lion', 'monkey', 'mouse', 'nan', 'tiger']
 
@@ -31,8 +35,8 @@ def infer(img: str or np.ndarray, n=1, scores=False):
         img = cv2.resize(img, (40, 40))
         img = np.reshape(img, (1, 40, 40, 3)).astype(np.float32)
 
-    input_name = model.get_inputs()[0].name
-    yhat = model.run(None, {input_name: img})[0][0]
+    with metrics.span('forward'):
+        yhat = model.run({model.input_names[0]: img})[0][0]
     x_maxN = plist.argmaxN(yhat, n)
     y_maxN = plist.maxN(yhat, n)
     predictions = [(class_names[x_maxN[i]], y_maxN[i]) for i in range(n)]
@@ -41,7 +45,8 @@ def infer(img: str or np.ndarray, n=1, scores=False):
     return predictions[::-1]
 
 
-def predict(images):
+@metrics.timed('preprocess')
+def _preprocess(images):
     images = [cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) for img in images]
     images = [cv2.threshold(img, 125, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1] for img in images]
     images = [cv2.morphologyEx(img, cv2.MORPH_OPEN, np.ones((2, 2))) for img in images]
@@ -77,6 +82,11 @@ def predict(images):
     images = [cv2.resize(img, (40, 40)).astype(np.float32) for img in images]
     images = [cv2.cvtColor(img, cv2.COLOR_GRAY2RGB) for img in images]
     images = [np.reshape(img, (1, 40, 40, 3)) for img in images]
+    return images
+
+
+def predict(images):
+    images = _preprocess(images)
     response = [infer(img, scores=True)[0] for img in images]
     response = [(x[0], str(x[1])) for x in response]
     return response
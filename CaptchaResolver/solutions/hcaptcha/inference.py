@@ -3,15 +3,109 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
-from .label_tools import split_prompt_message, label_cleaning, init_map
+from .label_tools import split_prompt_message, label_cleaning, LabelMapRefresher
+from ..tools.common import backends, metrics
 
 logger = logging.getLogger(__name__)
 
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-LABEL_MAP = init_map(update=True)
+model_name = "openai/clip-vit-base-patch32"
+# Optional ONNX export of CLIP run by onnxruntime or openvino, i.e: by
+# optimum-cli export onnx --model openai/clip-vit-base-patch32 --task zero-shot-image-classification <dir>
+onnx_path = os.path.join(os.path.dirname(__file__), 'assets', 'clip-vit-base-patch32.onnx')
+
+
+class TorchCLIP:
+    """CLIP on torch, text and image encoders can also run separately so that text embeddings are reused"""
+
+    def __init__(self):
+        import torch
+        self.torch = torch
+        self.clip = CLIPModel.from_pretrained(model_name).eval()
+
+    def __call__(self, inputs):
+        with self.torch.no_grad():
+            return self.clip(**{k: self.torch.from_numpy(v) for k, v in inputs.items()}).logits_per_image.numpy()
+
+    def encode_text(self, inputs):
+        """ :return: normalized text embeddings, (n_texts, dim) """
+        with self.torch.no_grad():
+            features = self.clip.get_text_features(input_ids=self.torch.from_numpy(inputs['input_ids']),
+                                                   attention_mask=self.torch.from_numpy(inputs['attention_mask']))
+        features = features.numpy()
+        return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+    def encode_image(self, pixel_values):
+        """ :return: normalized image embeddings, (n_images, dim) """
+        with self.torch.no_grad():
+            features = self.clip.get_image_features(pixel_values=self.torch.from_numpy(pixel_values)).numpy()
+        return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+
+def _load_onnx(backend):
+    runner = backends.OnnxRunner(onnx_path, backend)
+
+    def run(inputs):
+        return runner.run({k: v for k, v in inputs.items() if k in runner.input_names}, ['logits_per_image'])[0]
+
+    return run
+
+
+def _sample_inputs():
+    """ Inputs shaped like a challenge: one image against a few class names """
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 255, (128, 128, 3), dtype=np.uint8)) for _ in range(2)]
+    return [processor(text=['a bus', 'a truck', 'a car', 'a motorbus'], images=image, return_tensors="np", padding=True)
+            for image in images]
+
+
+_start_time = time.perf_counter()
+processor = CLIPProcessor.from_pretrained(model_name)
+_loaders = {'torch': TorchCLIP}
+if os.path.exists(onnx_path):
+    _loaders.update({'onnxruntime': lambda: _load_onnx('onnxruntime'), 'openvino': lambda: _load_onnx('openvino')})
+backend, model = backends.selector.select('clip-vit-base-patch32', _loaders, default='torch', inputs=_sample_inputs,
+                                          run=lambda m, x: m(dict(x)))
+metrics.model_loaded('clip-vit-base-patch32', time.perf_counter() - _start_time)
+# Fast tokenizers cannot be shared by threads
+_tokenizer_lock = threading.Lock()
+
+
+class TextEmbeddings:
+    """Text embeddings of the class names of each label, computed in background when label map entries are added"""
+
+    def __init__(self):
+        self._cache = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='clip-text-embeddings')
+
+    def get(self, label, class_names):
+        entry = self._cache.get(label)
+        return entry[1] if entry is not None and entry[0] == tuple(class_names) else None
+
+    def compute(self, label, class_names):
+        with _tokenizer_lock:
+            inputs = processor(text=class_names, return_tensors="np", padding=True)
+        embeddings = model.encode_text(dict(inputs))
+        self._cache[label] = (tuple(class_names), embeddings)
+        return embeddings
+
+    def precompute(self, entries: dict):
+        """ Compute embeddings of {label: class_names} in background """
+        if hasattr(model, 'encode_text'):
+            for label, class_names in entries.items():
+                self._executor.submit(self.compute, label, class_names)
+
+
+text_embeddings = TextEmbeddings()
+label_map = LabelMapRefresher(on_update=text_embeddings.precompute)
+text_embeddings.precompute(label_map.map)
+label_map.start()
 
 
 def predict(prompt, images):
@@ -21,24 +115,34 @@ def predict(prompt, images):
     :param images: list of images in PIL.Image format
     :return:
     """
-    global LABEL_MAP
-
     _label = split_prompt_message(prompt)
     label = label_cleaning(_label)
-    if label not in LABEL_MAP.keys():
+    current_map = label_map.map
+    metrics.cache_lookup('label_map', label in current_map)
+    if label not in current_map:
         logger.error(f"The label [{label}] is not yet mapped!")
-        LABEL_MAP = init_map(update=True)
-        # Send email only once here just to notify me
+        label_map.request_refresh()
         return False
 
-    class_names = LABEL_MAP[label]
+    class_names = current_map[label]
+    if hasattr(model, 'encode_image'):
+        text_features = text_embeddings.get(label, class_names)
+        metrics.cache_lookup('text_embeddings', text_features is not None)
+        if text_features is None:
+            text_features = text_embeddings.compute(label, class_names)
+        with metrics.span('preprocess'):
+            pixel_values = processor(images=images, return_tensors="np")['pixel_values']
+        with metrics.span('forward'):
+            image_features = model.encode_image(pixel_values)
+        predictions = np.argmax(image_features @ text_features.T, axis=1)
+        return [class_names[i] == label for i in predictions]
+
     results = []
     for image in images:
-        inputs = processor(text=class_names, images=image, return_tensors="pt", padding=True)
-        outputs = model(**inputs)
-        logits_per_image = outputs.logits_per_image
-        probs = logits_per_image.softmax(dim=1)
-        np_prob = probs.detach().numpy()
-        prediction = class_names[np.argmax(np_prob)]
+        with metrics.span('preprocess'), _tokenizer_lock:
+            inputs = processor(text=class_names, images=image, return_tensors="np", padding=True)
+        with metrics.span('forward'):
+            logits_per_image = model(dict(inputs))
+        prediction = class_names[np.argmax(logits_per_image)]
         results.append(prediction == label)
     return results
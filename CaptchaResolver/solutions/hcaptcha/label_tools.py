@@ -1,12 +1,15 @@
+import json
 import logging
 import os
 import re
-from ..tools.common.pull import pull_asset
+import threading
+import time
+from ..tools.common.assets import manager as asset_manager
 
+import requests
 import yaml
 
 logger = logging.getLogger(__name__)
-release_tag = 'v2.0'
 map_name = 'label_map.yaml'
 map_path = os.path.join(os.path.dirname(__file__), 'assets', map_name)
 BAD_CODE = {
@@ -46,8 +49,111 @@ def split_prompt_message(prompt_message: str) -> str:
 
 
 def init_map(update=False):
-    if not os.path.exists(map_path) or update:
-        pull_asset(release_tag, map_name, os.path.dirname(map_path))
+    asset_manager.ensure([map_name], {map_name: os.path.dirname(map_path)}, update=update)
     with open(map_path, 'r') as file:
         LABEL_MAP = yaml.safe_load(file)['MAP']
     return LABEL_MAP
+
+
+class LabelMapRefresher:
+    """
+    Keep the label map up to date in background
+    The map is fetched with conditional GET (ETag/Last-Modified) periodically or on demand, at most one refresh runs at
+    a time and the in-memory map is swapped in one assignment so readers never see a partial map
+    """
+
+    def __init__(self, interval=3600, min_interval=60, on_update=None, timeout=10):
+        """
+        :param interval: seconds between two periodic refreshes
+        :param min_interval: min seconds between two refreshes, on-demand requests within it are ignored
+        :param on_update: function({label: class_names}) called with added or changed entries after a swap
+        :param timeout: timeout of the request in seconds
+        """
+
+        self.interval = interval
+        self.min_interval = min_interval
+        self.on_update = on_update
+        self.timeout = timeout
+        self.meta_path = f"{map_path}.meta"
+        self.map = init_map()
+        self.refreshed_at = 0.0
+        self._running = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path, 'r') as f:
+            return json.load(f)
+
+    def _fetch(self):
+        """ :return: new map content or None if not modified """
+        if asset_manager.offline:
+            asset_manager.fetch(map_name, os.path.dirname(map_path), update=True)
+            with open(map_path, 'r') as file:
+                return file.read()
+
+        meta = self._load_meta()
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        response = requests.get(asset_manager.url(map_name), headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        part = f"{map_path}.part"
+        with open(part, 'wb') as f:
+            f.write(response.content)
+        os.replace(part, map_path)
+        with open(self.meta_path, 'w') as f:
+            json.dump({'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}, f)
+        return response.text
+
+    def refresh(self):
+        """
+        Refresh the map now unless another refresh is running
+        :return: {label: class_names} added or changed, None if skipped or failed
+        """
+
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            self.refreshed_at = time.monotonic()
+            content = self._fetch()
+            if content is None:
+                logger.info("[LabelMap] Not modified")
+                return {}
+            new_map = yaml.safe_load(content)['MAP']
+            changed = {k: v for k, v in new_map.items() if self.map.get(k) != v}
+            self.map = new_map
+            logger.info(f"[LabelMap] Refreshed, {len(changed)} labels added or changed")
+            if changed and self.on_update is not None:
+                self.on_update(changed)
+            return changed
+        except Exception as e:
+            logger.warning(f"[LabelMap] Refresh failed, keeping current map: {e}")
+            return None
+        finally:
+            self._running.release()
+
+    def request_refresh(self):
+        """ Schedule a refresh, never blocks """
+        if time.monotonic() - self.refreshed_at >= self.min_interval and not self._running.locked():
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """ Refresh now and then every interval in background """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='label-map-refresher', daemon=True)
+            self._thread.start()
+        return self
@@ -1,7 +1,13 @@
+import os.path
+
 from .detector import Detector, Label
+from .profiles import Profiles
+from ...tools.common.degrade import DegradationController
 
 detector = Detector()
 label_manager = Label(detector.label_path)
+profiles = Profiles(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'profiles.yaml'))
+degradation = DegradationController(lambda: profiles.section('degradation'))
 
 
-__all__ = ['detector', 'label_manager']
+__all__ = ['detector', 'label_manager', 'profiles', 'degradation']
@@ -1,17 +1,46 @@
 import logging
 import os.path
+import threading
+import time
 
-import requests
+import numpy as np
 import yaml
+from ultralytics import YOLO as OnnxYOLO
 from ultralyticsplus import YOLO
-from ...tools.common.pull import pull_asset
+from ...tools.common import backends, metrics
+from ...tools.common.assets import manager as asset_manager
 
 logging.getLogger("ultralyticsplus").setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
 ASSETS = ['re-detector-v1.pt', 're-detector-v2.pt', 'yolov8s-seg.pt', 'crosswalk-seg.pt', 'stair-seg.pt',
           'yolo.yaml', 'objects.yaml', 'alias.yaml', 're-detector-v1.yaml', 're-detector-v2.yaml', ]
-release_tag = 'v1.0'
+# Build variant of each backend, see build_models
+BACKEND_VARIANTS = {'onnxruntime': 'onnx-fp32', 'openvino': 'openvino-fp32'}
+# Load each model on its first request instead of at startup, nodes behind label-affinity routing then only load the
+# models of their labels
+LAZY_MODELS = os.environ.get('RESOLVER_LAZY_MODELS', '0').lower() in ('1', 'true')
+
+
+class LazyModels(dict):
+    """Models loaded on first access, `name in models` is true for every model that can be loaded"""
+
+    def __init__(self, names, load):
+        super().__init__()
+        self.names = set(names)
+        self._load = load
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __missing__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        with self._lock:
+            if not dict.__contains__(self, name):
+                self[name] = self._load(name)
+            return dict.__getitem__(self, name)
 
 
 class Detector:
@@ -26,9 +55,9 @@ class Detector:
             os.makedirs(self.label_dir, exist_ok=True)
         else:
             self.label_dir = label_dir
+        self.manifest_path = os.path.join(os.path.dirname(self.model_dir), 'manifest.yaml')
         self.models = {}
         self.labels = {}
-        self.class_names = []
         self._pull()
         self._load()
 
@@ -41,68 +70,132 @@ class Detector:
         return self.model_dir
 
     def _pull(self):
+        directories = {}
         for asset_name in ASSETS:
             if asset_name.endswith('.pt') or asset_name.endswith('.onnx'):
-                local_storage_dir = self.model_dir
+                directories[asset_name] = self.model_dir
             elif asset_name.endswith('.yaml'):
-                local_storage_dir = self.label_dir
+                directories[asset_name] = self.label_dir
             else:
                 raise Exception('Unknown asset')
-
-            if not os.path.exists(os.path.join(local_storage_dir, asset_name)):
-                pull_asset(release_tag, asset_name, local_storage_dir)
+        asset_manager.ensure(ASSETS, directories)
 
     def _load_classes(self):
         for mn in os.listdir(self.label_dir):
             with open(os.path.join(self.label_dir, mn), 'r') as f:
                 self.labels[mn.replace('.yaml', '')] = yaml.safe_load(f)
 
+    def _load_manifest(self):
+        """Builds of each model written by build_models, models pins the variant to load"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r') as f:
+            return yaml.safe_load(f) or {}
+
+    @staticmethod
+    def _sample_images():
+        """ Synthetic 3x3 tile, 1x1 and 4x4 sized images to time backends """
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (h, w, 3), dtype=np.uint8) for h, w in ((100, 100), (300, 300), (450, 450))]
+
+    def _load_model(self, mn, manifest):
+        """
+        Load variant of model pinned in manifest, else the ONNX/OpenVINO build or the original .pt on the backend chosen
+        by backends.selector
+        """
+
+        name = mn.removesuffix('.pt')
+        assets_dir = os.path.dirname(self.manifest_path)
+        entry = (manifest.get('models') or {}).get(name)
+        if entry is not None and entry.get('format') in ('onnx', 'openvino'):
+            path = os.path.join(assets_dir, entry['path'])
+            if os.path.exists(path):
+                logger.info(f"Loading {entry['variant']} variant of {mn}")
+                return OnnxYOLO(path, task=entry['task'])
+            logger.warning(f"{entry['variant']} variant of {mn} not found at {path}, loading {mn}")
+            return YOLO(os.path.join(self.model_dir, mn))
+
+        loaders = {'torch': lambda: YOLO(os.path.join(self.model_dir, mn))}
+        for backend, variant in BACKEND_VARIANTS.items():
+            build = ((manifest.get('variants') or {}).get(name) or {}).get(variant)
+            if build is not None and os.path.exists(os.path.join(assets_dir, build['path'])):
+                loaders[backend] = lambda b=build: OnnxYOLO(os.path.join(assets_dir, b['path']), task=b['task'])
+        backend, model = backends.selector.select(name, loaders, default='torch', inputs=self._sample_images,
+                                                  run=lambda m, img: m.predict(img, verbose=False))
+        return model
+
     def _load_models(self):
-        for mn in os.listdir(self.model_dir):
-            model = YOLO(os.path.join(self.model_dir, mn))
-            model.overrides['iou'] = 0.45
-            model.overrides['agnostic_nms'] = False
-            model.overrides['max_det'] = 50
-            model.overrides['conf'] = 0.25
-            self.models[mn.removesuffix('.pt')] = model
+        manifest = self._load_manifest()
+
+        def load(name):
+            start_time = time.perf_counter()
+            model = self._load_model(f'{name}.pt', manifest)
+            metrics.model_loaded(f'{name}.pt', time.perf_counter() - start_time)
+            return model
+
+        names = [mn.removesuffix('.pt') for mn in os.listdir(self.model_dir) if mn.endswith('.pt')]
+        if LAZY_MODELS:
+            logger.info(f"Models {names} are loaded on first use")
+            self.models = LazyModels(names, load)
+            return
+        for name in names:
+            self.models[name] = load(name)
 
     def _load(self):
         self._load_classes()
         self._load_models()
 
     def choose_net_3x3(self, label):
+        """
+        :return: net and its class names
+        """
+
         if label in self.labels['re-detector-v1']['classes']:
-            self.class_names = self.labels['re-detector-v1']['classes']
-            return self.models['re-detector-v1']
+            return self.models['re-detector-v1'], self.labels['re-detector-v1']['classes']
         elif label in self.labels['re-detector-v2']['classes']:
-            self.class_names = self.labels['re-detector-v2']['classes']
-            return self.models['re-detector-v2']
+            return self.models['re-detector-v2'], self.labels['re-detector-v2']['classes']
         else:
             raise Exception
 
-    def choose_net_4x4(self, label):
-        net = self.models['yolov8s-seg']
-        self.class_names = self.labels['yolo']['classes']
+    @staticmethod
+    def net_name_4x4(label):
         if label == 'stair':
-            net = self.models['stair-seg']
-            self.class_names = ['stair']
+            return 'stair-seg'
         elif label == 'crosswalk':
-            net = self.models['crosswalk-seg']
-            self.class_names = ['crosswalk']
-        return net
+            return 'crosswalk-seg'
+        return 'yolov8s-seg'
+
+    def choose_net_4x4(self, label):
+        """
+        :return: net and its class names
+        """
+
+        name = self.net_name_4x4(label)
+        class_names = [label] if name in ('stair-seg', 'crosswalk-seg') else self.labels['yolo']['classes']
+        return self.models[name], class_names
 
-    def predict(self, img, net, conf=0.2, verbose=False):
+    @staticmethod
+    def predict(img, net, class_names, conf=0.2, iou=0.45, max_det=50, imgsz=640, classes=None, verbose=False):
         """
         Predict yolo classes for yolov8
         :param verbose: show details
         :param img: np_array in cv2 format
         :param net: deep neural network
+        :param class_names: class names of net from choose_net_3x3 or choose_net_4x4
         :param conf: confidence for object detection
+        :param iou: NMS IoU threshold
+        :param max_det: max detections
+        :param imgsz: input size of the network
+        :param classes: class names kept by NMS, all classes if None
         :return: {'classes': [cls, n], 'boxes': [[x, y, x, y], n], 'scores': [float, n]}
         """
 
-        results = net.predict(img, conf=conf, verbose=verbose)
-        cls = [self.class_names[int(x)] for x in results[0].boxes.cls]
+        if classes is not None:
+            classes = [class_names.index(c) for c in classes if c in class_names] or None
+        with metrics.span('forward'):
+            results = net.predict(img, conf=conf, iou=iou, max_det=max_det, imgsz=imgsz, classes=classes,
+                                  verbose=verbose)
+        cls = [class_names[int(x)] for x in results[0].boxes.cls]
         scores = [float(x) for x in results[0].boxes.conf]
         boxes = [[int(x) for x in box] for box in list(results[0].boxes.xyxy)]
         masks = results[0].masks
@@ -0,0 +1,82 @@
+import logging
+import os.path
+import threading
+import time
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+class Profiles:
+    """
+    Inference profile (imgsz, conf, iou, max_det, classes) of each grid and label read from profiles.yaml
+    The file is reloaded when it changes, a label profile overrides its grid profile which overrides the default one
+    """
+
+    KEYS = ('imgsz', 'conf', 'iou', 'max_det', 'classes')
+
+    def __init__(self, path, check_interval=1.0):
+        """
+        :param path: path of profiles.yaml
+        :param check_interval: seconds between two checks of the file modification time
+        """
+
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._config = {}
+        self._cache = {}
+        self._reload()
+
+    def _reload(self):
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                config = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.error(f"Cannot load inference profiles from {self.path}, keeping previous ones: {e}")
+            return
+        unknown = {k for profile in self._profiles(config) for k in profile or {} if k not in self.KEYS}
+        if unknown:
+            logger.warning(f"Unknown keys in inference profiles: {sorted(unknown)}")
+        self._config, self._cache, self._mtime = config, {}, mtime
+        logger.info(f"Loaded inference profiles from {self.path}")
+
+    @staticmethod
+    def _profiles(config):
+        yield config.get('default') or {}
+        for grid in (config.get('grids') or {}).values():
+            yield from (grid or {}).values()
+
+    def _check(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._reload()
+
+    def section(self, name):
+        """ Other top level section of profiles.yaml, i.e: degradation """
+        self._check()
+        return self._config.get(name)
+
+    def get(self, label, grid):
+        """
+        :return: {'imgsz': int, 'conf': float, 'iou': float, 'max_det': int, 'classes': 'target' or [names] or None}
+        """
+
+        self._check()
+        config, cache = self._config, self._cache
+        if (label, grid) not in cache:
+            grid_profiles = (config.get('grids') or {}).get(grid) or {}
+            profile = {}
+            for p in (config.get('default'), grid_profiles.get('default'), grid_profiles.get(label)):
+                profile.update({k: v for k, v in (p or {}).items() if k in self.KEYS})
+            cache[(label, grid)] = profile
+        return cache[(label, grid)]
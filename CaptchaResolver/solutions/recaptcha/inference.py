@@ -1,32 +1,79 @@
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 
 import numpy as np
 
 from .api import label_manager
 from .api import detector
+from .api import profiles
+from .api import degradation
+from ..tools.common import metrics
 from ..tools.pre_processing import plist, pimage
 from ..tools.pre_processing.pgeometry import Rectangle
 
 logger = logging.getLogger(__name__)
+# Recent 4x4 answers, served by `cached_only` degradation tiers
+RESULTS_CACHE_SIZE = 512
+_results_cache = OrderedDict()
+_results_lock = threading.Lock()
 
 
-def predict(img, label, grid):
+def get_profile(label, grid):
+    """ Inference profile of label and grid with `classes: target` resolved to class names """
+    profile = dict(profiles.get(label, grid))
+    if profile.get('classes') == 'target':
+        profile['classes'] = [label, *label_manager.merge_objects.get(label, ())]
+    return profile
+
+
+def choose_tier(label, grid):
+    """
+    Degradation tier serving given request, only 4x4 segmentation is degraded under load
+    :return: tier dict or None
+    """
+
+    if grid != '4x4':
+        return None
+    return degradation.tier(detector.net_name_4x4(label_manager.clean_label(label)))
+
+
+def _cache_key(img, label):
+    return label, hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16).digest()
+
+
+def _cache_results(key, results):
+    with _results_lock:
+        _results_cache[key] = results
+        _results_cache.move_to_end(key)
+        while len(_results_cache) > RESULTS_CACHE_SIZE:
+            _results_cache.popitem(last=False)
+
+
+def predict(img, label, grid, tier=None):
+    """
+    :param tier: degradation tier of 4x4 requests from choose_tier, full accuracy if None
+    """
+
     label = label_manager.clean_label(label)
     if label not in label_manager.objects:
         logger.info(f"Label: {label} not currently solved!")
         return False
 
     # Inference
+    profile = get_profile(label, grid)
     if grid == '3x3':
-        imgs = pimage.split(img, structure=(int(grid.split('x')[0]), int(grid.split('x')[1])))
-        imgs = plist.transpose(imgs)
-        imgs = sum(imgs, [])
-        net = detector.choose_net_3x3(label)
+        with metrics.span('split'):
+            imgs = pimage.split(img, structure=(int(grid.split('x')[0]), int(grid.split('x')[1])))
+            imgs = plist.transpose(imgs)
+            imgs = sum(imgs, [])
+        net, class_names = detector.choose_net_3x3(label)
         print(net, label)
         # Inference and get top 3 predictions
         scores = []
         for img in imgs:
-            detection = detector.predict(img, net, conf=0.25, verbose=False)
+            detection = detector.predict(img, net, class_names, **profile)
             if label == 'motorcycle' and 'bicycle' in detection['classes']:
                 detection['classes'][detection['classes'].index('bicycle')] = 'motorcycle'
             if label in detection['classes']:
@@ -44,10 +91,10 @@ def predict(img, label, grid):
         return results
     elif grid == "1x1":
         imgs = img
-        net = detector.choose_net_3x3(label)
+        net, class_names = detector.choose_net_3x3(label)
         results = []
         for img in imgs:
-            res = detector.predict(img, net, conf=0.3)
+            res = detector.predict(img, net, class_names, **profile)
             if label in res['classes']:
                 results.append(True)
             else:
@@ -57,8 +104,21 @@ def predict(img, label, grid):
                     results.append(False)
         return results
     else:
-        net = detector.choose_net_4x4(label)
-        detection = detector.predict(img, net, conf=0.2, verbose=True)
+        key = _cache_key(img, label)
+        net, class_names = detector.choose_net_4x4(label)
+        if tier is not None:
+            if tier.get('cached_only'):
+                with _results_lock:
+                    cached = _results_cache.get(key)
+                metrics.cache_lookup('recaptcha_4x4_results', cached is not None)
+                return cached if cached is not None else False
+            if tier.get('model') is not None:
+                if tier['model'] in detector.models:
+                    net = detector.models[tier['model']]
+                else:
+                    logger.warning(f"Model {tier['model']} of tier {tier['name']} is not loaded")
+            profile.update({k: v for k, v in tier.items() if k in profiles.KEYS})
+        detection = detector.predict(img, net, class_names, **profile, verbose=True)
 
         # filtering real objects
         if label in label_manager.merge_objects.keys():
@@ -68,46 +128,48 @@ def predict(img, label, grid):
             logger.info("Return false because no class is detected by YOLO")
             return False
 
-        H, W = img.shape[0], img.shape[1]
-        segments = [detection['masks'].segments[i] for i in idx]
-        segmentations = []
-        for segment in segments:
-            segment[:, 0] = segment[:, 0] * W
-            segment[:, 1] = segment[:, 1] * H
-            segmentation = [segment.ravel().tolist()]
-            points = [np.array(point).reshape(-1, 2).round().astype(int) for point in segmentation]
-            segmentations.append(points)
-
-        # Make small images coordinates
-        coordinates = []
-        spX, spY = img.shape[0] / 4, img.shape[1] / 4
-        for m in range(4):
-            for n in range(4):
-                x, y, w, h = int(spX * n), int(spY * m), int(spX), int(spY)
-                c = Rectangle([x, y, w, h])
-                coordinates.append(c)
-
-        # segment to contours
-        blank_img = np.zeros(img.shape)
-        color = (0, 0, 255)
-        for segment in segmentations:
-            pimage.draw_mask(blank_img, segment, color=color)
-        indices = np.where((blank_img == [0, 0, 255]).all(axis=2))
-        points = [np.array([x, y]) for y, x in zip(indices[0], indices[1])]
-
-        # Mark if point in object
-        results = []
-        for c in coordinates:
-            is_in = False
-            for p in points:
-                if c.in_point(p):
-                    is_in = True
-                    break
-            if not is_in:
-                for segment in segmentations:
-                    if c.in_mask(segment[0]):
+        with metrics.span('postprocess'):
+            H, W = img.shape[0], img.shape[1]
+            segments = [detection['masks'].segments[i] for i in idx]
+            segmentations = []
+            for segment in segments:
+                segment[:, 0] = segment[:, 0] * W
+                segment[:, 1] = segment[:, 1] * H
+                segmentation = [segment.ravel().tolist()]
+                points = [np.array(point).reshape(-1, 2).round().astype(int) for point in segmentation]
+                segmentations.append(points)
+
+            # Make small images coordinates
+            coordinates = []
+            spX, spY = img.shape[0] / 4, img.shape[1] / 4
+            for m in range(4):
+                for n in range(4):
+                    x, y, w, h = int(spX * n), int(spY * m), int(spX), int(spY)
+                    c = Rectangle([x, y, w, h])
+                    coordinates.append(c)
+
+            # segment to contours
+            blank_img = np.zeros(img.shape)
+            color = (0, 0, 255)
+            for segment in segmentations:
+                pimage.draw_mask(blank_img, segment, color=color)
+            indices = np.where((blank_img == [0, 0, 255]).all(axis=2))
+            points = [np.array([x, y]) for y, x in zip(indices[0], indices[1])]
+
+            # Mark if point in object
+            results = []
+            for c in coordinates:
+                is_in = False
+                for p in points:
+                    if c.in_point(p):
                         is_in = True
                         break
-            results.append(is_in)
+                if not is_in:
+                    for segment in segmentations:
+                        if c.in_mask(segment[0]):
+                            is_in = True
+                            break
+                results.append(is_in)
 
+        _cache_results(key, results)
         return results
@@ -0,0 +1,161 @@
+"""
+Deadline-aware admission control in front of the inference workers
+
+Clients send their remaining time with `X-Resolver-Budget: <seconds>` or `X-Resolver-Deadline: <unix time>`, requests
+without them get the default budget. Work is served earliest deadline first, a request whose deadline cannot be met
+given the work queued ahead of it is refused at once with Overloaded, and work that expired while queued is dropped
+before inference with Expired
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from . import degrade, metrics
+
+logger = logging.getLogger(__name__)
+metrics.REGISTRY.describe('resolver_shed_total', 'Requests shed by reason, overloaded at admission or expired in queue')
+metrics.REGISTRY.describe('resolver_queue_wait_seconds', 'Time requests waited in the admission queue')
+metrics.REGISTRY.describe('resolver_queue_depth', 'Requests waiting in the admission queue')
+
+BUDGET_HEADER = 'X-Resolver-Budget'
+DEADLINE_HEADER = 'X-Resolver-Deadline'
+WORKERS = int(os.environ.get('RESOLVER_WORKERS', os.cpu_count() or 4))
+DEFAULT_BUDGET = float(os.environ.get('RESOLVER_DEFAULT_BUDGET', 60))
+_context = threading.local()
+
+
+def current_deadline():
+    """ time.monotonic() deadline of the request run by current thread, None outside admission workers """
+    return getattr(_context, 'deadline', None)
+
+
+class Overloaded(Exception):
+    """Estimated wait exceeds the budget of the request"""
+
+
+class Expired(Exception):
+    """Deadline passed while the request was queued"""
+
+
+class AdmissionQueue:
+    """Earliest-deadline-first work queue served by a fixed number of worker threads"""
+
+    def __init__(self, workers=WORKERS, default_budget=DEFAULT_BUDGET, alpha=0.2):
+        """
+        :param workers: threads running inference
+        :param default_budget: budget in seconds of requests without deadline
+        :param alpha: smoothing of the service time estimate of each kind of request
+        """
+
+        self.workers = workers
+        self.default_budget = default_budget
+        self.alpha = alpha
+        self.service_time = {}
+        self._heap = []
+        self._busy = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._started = False
+
+    def deadline(self, headers):
+        """ Monotonic deadline of request from its headers """
+        now = time.monotonic()
+        try:
+            if headers.get(BUDGET_HEADER):
+                return now + float(headers[BUDGET_HEADER])
+            if headers.get(DEADLINE_HEADER):
+                return now + float(headers[DEADLINE_HEADER]) - time.time()
+        except ValueError:
+            logger.warning(f"[Admission] Invalid deadline headers: {headers.get(BUDGET_HEADER)}, "
+                           f"{headers.get(DEADLINE_HEADER)}")
+        return now + self.default_budget
+
+    @property
+    def depth(self):
+        """ Requests waiting in the queue """
+        return len(self._heap)
+
+    def _expected(self, kind):
+        if kind in self.service_time:
+            return self.service_time[kind]
+        return sum(self.service_time.values()) / len(self.service_time) if self.service_time else 0.0
+
+    def estimated_wait(self, deadline):
+        """ Seconds before a request with given deadline would start, caller holds the lock """
+        ahead = sum(expected for d, _, expected, *_ in self._heap if d <= deadline)
+        if len(self._busy) >= self.workers:
+            # Every worker is busy, the first one frees up once its remaining service time is over
+            now = time.monotonic()
+            ahead += min(max(0.0, started + expected - now) for started, expected in self._busy.values()) * self.workers
+        return ahead / self.workers
+
+    def submit(self, fn, *args, deadline=None, kind=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs)
+        :param deadline: time.monotonic() deadline, default budget if None
+        :param kind: requests of the same kind share a service time estimate, i.e: recaptcha/3x3
+        :raise Overloaded: if the request cannot be served before its deadline
+        :return: concurrent.futures.Future, raises Expired if the deadline passed while queued
+        """
+
+        deadline = time.monotonic() + self.default_budget if deadline is None else deadline
+        future = Future()
+        with self._cond:
+            if not self._started:
+                # Workers start with the first request so that unused queues cost nothing
+                for i in range(self.workers):
+                    threading.Thread(target=self._worker, name=f'resolver-worker-{i}', daemon=True).start()
+                self._started = True
+            expected = self._expected(kind)
+            wait = self.estimated_wait(deadline)
+            if time.monotonic() + wait + expected > deadline:
+                metrics.inc('resolver_shed_total', reason='overloaded', kind=kind or '')
+                raise Overloaded(f"Estimated wait {wait:.2f}s exceeds budget")
+            heapq.heappush(self._heap, (deadline, next(self._seq), expected, time.monotonic(), kind, future, fn,
+                                        args, kwargs))
+            metrics.gauge('resolver_queue_depth', len(self._heap))
+            self._cond.notify()
+        return future
+
+    def run(self, fn, *args, deadline=None, kind=None, **kwargs):
+        """ Same as submit but wait for the result """
+        return self.submit(fn, *args, deadline=deadline, kind=kind, **kwargs).result()
+
+    def _worker(self):
+        ident = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, _, expected, queued_at, kind, future, fn, args, kwargs = heapq.heappop(self._heap)
+                metrics.gauge('resolver_queue_depth', len(self._heap))
+                now = time.monotonic()
+                metrics.observe('resolver_queue_wait_seconds', now - queued_at, kind=kind or '')
+                degrade.load.record_queue_wait(now - queued_at)
+                if now >= deadline:
+                    metrics.inc('resolver_shed_total', reason='expired', kind=kind or '')
+                    future.set_exception(Expired(f"Deadline passed {now - deadline:.2f}s ago after "
+                                                 f"{now - queued_at:.2f}s in queue"))
+                    continue
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._busy[ident] = (now, expected)
+
+            _context.deadline = deadline
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                _context.deadline = None
+                service_time = time.monotonic() - now
+                with self._cond:
+                    del self._busy[ident]
+                    previous = self.service_time.get(kind)
+                    self.service_time[kind] = service_time if previous is None else \
+                        previous + self.alpha * (service_time - previous)
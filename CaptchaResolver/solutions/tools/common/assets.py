@@ -0,0 +1,238 @@
+"""
+Models and label files of the resolver, listed in assets.yaml with their release tag, size and sha256
+
+Missing assets are fetched in parallel, each of them streamed to <name>.part (resumed if present) and renamed once
+its size and checksum match the manifest. Assets without checksum in the manifest are accepted with a warning, or refused
+with require_checksums (RESOLVER_REQUIRE_CHECKSUMS=1), until `python -m pull_assets lock` pins them. In offline mode assets are only copied from a local mirror directory, the network is never
+touched. Assets that cannot be fetched raise MissingAssetsError, they never prompt
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import yaml
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+MANIFEST_PATH = os.path.join(ROOT, 'assets.yaml')
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_HEADER = """# Assets of the resolver, downloaded from <release_url>/<tag>/<name> into <path> (relative to CaptchaResolver)
+# size and sha256 are verified when set, `python -m pull_assets lock` fills them from local files, assets without them
+# are accepted with a warning unless require_checksums: true (or RESOLVER_REQUIRE_CHECKSUMS=1)
+# mutable assets (updated upstream without a new tag) are never checksummed
+# offline: true (or RESOLVER_OFFLINE=1) never touches the network, assets are copied from mirror (or RESOLVER_ASSET_MIRROR)
+"""
+
+
+class MissingAssetsError(Exception):
+    """Assets are neither on disk nor could be fetched"""
+
+    def __init__(self, missing: dict):
+        self.missing = missing
+        super().__init__("Missing assets: " + ', '.join(f"{name} ({reason})" for name, reason in missing.items()))
+
+
+def sha256sum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetManager:
+    """Fetch, verify and report the assets listed in the manifest"""
+
+    def __init__(self, manifest_path=MANIFEST_PATH, mirror=None, offline=None, require_checksums=None, workers=4,
+                 timeout=30, retries=3):
+        """
+        :param manifest_path: assets.yaml
+        :param mirror: local directory holding assets as <mirror>/<tag>/<name> or <mirror>/<name>, tried before network
+        :param offline: only use existing files and mirror, default from RESOLVER_OFFLINE or manifest
+        :param require_checksums: refuse assets that are not mutable and have no sha256 in the manifest, default from
+                                  RESOLVER_REQUIRE_CHECKSUMS or manifest
+        :param workers: parallel downloads
+        :param timeout: seconds without data before a download is retried
+        :param retries: attempts per download, each attempt resumes the previous one
+        """
+
+        with open(manifest_path, 'r') as f:
+            manifest = yaml.safe_load(f) or {}
+        self.manifest_path = manifest_path
+        self.release_url = manifest['release_url']
+        self.assets = {asset['name']: asset for asset in manifest.get('assets') or []}
+        self.mirror = mirror or os.environ.get('RESOLVER_ASSET_MIRROR') or manifest.get('mirror')
+        if offline is None:
+            offline = os.environ.get('RESOLVER_OFFLINE', str(manifest.get('offline', False))).lower() in ('1', 'true')
+        self.offline = offline
+        if require_checksums is None:
+            require_checksums = os.environ.get('RESOLVER_REQUIRE_CHECKSUMS',
+                                               str(manifest.get('require_checksums', False))).lower() in ('1', 'true')
+        self.require_checksums = require_checksums
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._status = {}
+        self._unpinned = set()
+
+    def url(self, name):
+        """ Release url of asset """
+        return f"{self.release_url}/{self.assets[name]['tag']}/{name}"
+
+    def path(self, name, directory=None):
+        """ Local path of asset """
+        return os.path.join(directory or os.path.join(ROOT, self.assets[name]['path']), name)
+
+    def status(self):
+        """ {name: 'ok' or reason it is missing} of every asset requested so far """
+        with self._lock:
+            return dict(self._status)
+
+    @property
+    def ready(self):
+        return all(s == 'ok' for s in self.status().values())
+
+    def _set_status(self, name, status):
+        with self._lock:
+            self._status[name] = status
+
+    def pinned(self, name):
+        """ Asset has a sha256 in the manifest or is mutable, which are never checksummed """
+        asset = self.assets[name]
+        return bool(asset.get('mutable')) or asset.get('sha256') is not None
+
+    def verify(self, name, path):
+        """
+        Size and sha256 of file match manifest, unset values are not checked
+        Assets that are not pinned fail with require_checksums, else pass with a warning
+        """
+
+        asset = self.assets[name]
+        if not self.pinned(name):
+            with self._lock:
+                warn = name not in self._unpinned
+                self._unpinned.add(name)
+            if self.require_checksums:
+                logger.error(f"[Assets] {name} has no sha256 in manifest and checksums are required")
+                return False
+            if warn:
+                logger.warning(f"[Assets] {name} has no sha256 in manifest, it is not verified, "
+                               f"run `python -m pull_assets lock` on trusted copies to pin it")
+        if asset.get('size') is not None and os.path.getsize(path) != asset['size']:
+            return False
+        return asset.get('sha256') is None or sha256sum(path) == asset['sha256']
+
+    def _from_mirror(self, name, path):
+        if not self.mirror:
+            return False
+        for source in (os.path.join(self.mirror, self.assets[name]['tag'], name), os.path.join(self.mirror, name)):
+            if os.path.exists(source):
+                if not self.verify(name, source):
+                    logger.warning(f"[Assets] {source} does not match manifest checksum")
+                    continue
+                part = f"{path}.part"
+                shutil.copyfile(source, part)
+                os.replace(part, path)
+                logger.info(f"[Assets] Copied {name} from {source}")
+                return True
+        return False
+
+    def _download(self, name, path):
+        url = self.url(name)
+        part = f"{path}.part"
+        for attempt in range(1, self.retries + 1):
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = {'Range': f"bytes={offset}-"} if offset else {}
+            try:
+                with self.session.get(url, headers=headers, stream=True, timeout=(5, self.timeout)) as response:
+                    if response.status_code == 416:  # part is already complete
+                        pass
+                    elif response.status_code in (200, 206):
+                        mode = 'ab' if response.status_code == 206 else 'wb'
+                        logger.info(f"[Assets] Pulling {name}: {url}" + (f" from byte {offset}" if mode == 'ab' else ''))
+                        with open(part, mode) as f:
+                            for chunk in response.iter_content(CHUNK_SIZE):
+                                f.write(chunk)
+                    else:
+                        return f"HTTP {response.status_code} from {url}"
+            except requests.RequestException as e:
+                logger.warning(f"[Assets] Attempt {attempt}/{self.retries} of {name} failed: {e}")
+                continue
+
+            if self.verify(name, part):
+                os.replace(part, path)
+                return None
+            os.remove(part)
+            logger.warning(f"[Assets] {name} does not match manifest checksum, attempt {attempt}/{self.retries}")
+        return f"download failed after {self.retries} attempts"
+
+    def fetch(self, name, directory=None, update=False):
+        """
+        Make asset available on disk
+        :param update: fetch it again even if present, the local copy is kept if it fails
+        :return: 'ok' or reason it is missing
+        """
+
+        path = self.path(name, directory)
+        exists = os.path.exists(path)
+        if self.require_checksums and not self.pinned(name):
+            status = 'no sha256 in manifest (checksums required)'
+        elif exists and not update:
+            status = 'ok'
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self._from_mirror(name, path):
+                status = 'ok'
+            elif self.offline:
+                status = 'ok' if exists else 'not found locally or in mirror (offline mode)'
+            else:
+                error = self._download(name, path)
+                if error is not None and exists:
+                    logger.warning(f"[Assets] Could not update {name}, keeping local copy: {error}")
+                status = 'ok' if error is None or exists else error
+        self._set_status(name, status)
+        return status
+
+    def ensure(self, names, directories: dict = None, update=False):
+        """
+        Fetch missing assets in parallel
+        :param names: asset names
+        :param directories: {name: directory} to store assets elsewhere than in the manifest path
+        :param update: fetch them again even if present
+        :raise MissingAssetsError: if any asset is still missing
+        """
+
+        directories = directories or {}
+        unknown = [name for name in names if name not in self.assets]
+        if unknown:
+            raise MissingAssetsError({name: 'not listed in assets.yaml' for name in unknown})
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            statuses = dict(zip(names, executor.map(lambda n: self.fetch(n, directories.get(n), update), names)))
+        missing = {name: status for name, status in statuses.items() if status != 'ok'}
+        if missing:
+            raise MissingAssetsError(missing)
+
+    def lock(self, names=None):
+        """ Write size and sha256 of local assets into the manifest """
+        with open(self.manifest_path, 'r') as f:
+            manifest = yaml.safe_load(f)
+        for asset in manifest['assets']:
+            path = self.path(asset['name'])
+            if (names and asset['name'] not in names) or asset.get('mutable') or not os.path.exists(path):
+                continue
+            asset['size'], asset['sha256'] = os.path.getsize(path), sha256sum(path)
+            self.assets[asset['name']] = asset
+        with open(self.manifest_path, 'w') as f:
+            f.write(MANIFEST_HEADER)
+            yaml.safe_dump(manifest, f, sort_keys=False)
+
+
+manager = AssetManager()
@@ -0,0 +1,156 @@
+"""
+Inference backends (torch, onnxruntime, openvino) of the resolver models, each of them is optional
+
+Every model registers a loader per backend it can run on, the backend is chosen by `BackendSelector`::
+    1. backend saved in backends.yaml for this host
+    2. if autotune is enabled, the fastest available backend on representative inputs, saved for later startups
+    3. default backend of the model
+"""
+
+import importlib.util
+import logging
+import os
+import platform
+import threading
+import time
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = {'torch': 'torch', 'onnxruntime': 'onnxruntime', 'openvino': 'openvino'}
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'backends.yaml')
+
+
+def is_available(backend):
+    """ Is python package of given backend installed """
+    return importlib.util.find_spec(BACKENDS[backend]) is not None
+
+
+def host_id():
+    """ Backend timings only hold for the cpu they were measured on """
+    cpu = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    return f"{platform.machine()}|{cpu}|{os.cpu_count()}"
+
+
+class OnnxRunner:
+    """Run an ONNX model on onnxruntime or openvino with the interface of InferenceSession.run"""
+
+    def __init__(self, path, backend='onnxruntime'):
+        self.backend = backend
+        if backend == 'onnxruntime':
+            import onnxruntime
+            self._session = onnxruntime.InferenceSession(path)
+            self.input_names = [x.name for x in self._session.get_inputs()]
+        elif backend == 'openvino':
+            from openvino.runtime import Core
+            self._session = Core().compile_model(path, 'CPU')
+            self.input_names = [x.any_name for x in self._session.inputs]
+        else:
+            raise ValueError(f"{backend} cannot run ONNX models")
+
+    def run(self, inputs: dict, output_names=None):
+        """
+        :param inputs: {input name: np.ndarray}
+        :param output_names: names of outputs to return, all outputs if None
+        :return: list of np.ndarray
+        """
+
+        if self.backend == 'onnxruntime':
+            return self._session.run(output_names, inputs)
+        results = self._session(inputs)
+        if output_names is None:
+            return list(results.values())
+        return [results[name] for name in output_names]
+
+
+class BackendSelector:
+    """Choose, load and persist the backend of each model"""
+
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.config = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.config = yaml.safe_load(f) or {}
+        self.autotune = os.environ.get('RESOLVER_AUTOTUNE', str(self.config.get('autotune', False))).lower() in ('1', 'true')
+        self.host = host_id()
+
+    def _save(self, name, backend, timings):
+        with self._lock:
+            models = self.config.setdefault('models', {}) or {}
+            self.config['models'] = models
+            models.setdefault(name, {})[self.host] = {'backend': backend, 'timings_ms': timings}
+            with open(self.path, 'w') as f:
+                f.write("# Inference backend of each model: torch, onnxruntime or openvino\n"
+                        "# Set autotune to true (or RESOLVER_AUTOTUNE=1) to time every available backend at startup,\n"
+                        "# the fastest backend is saved per host under models so that later startups skip measuring\n")
+                yaml.safe_dump(self.config, f, sort_keys=True)
+
+    @staticmethod
+    def _load(name, backend, loader):
+        try:
+            return loader()
+        except Exception as e:
+            logger.warning(f"[Backends] {name} cannot be loaded on {backend}: {e}")
+            return None
+
+    @staticmethod
+    def benchmark(model, inputs, run, repeat=3):
+        """ Mean time in milliseconds of run(model, x) over inputs after one warmup """
+        for x in inputs:
+            run(model, x)
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            for x in inputs:
+                run(model, x)
+        return (time.perf_counter() - start_time) / (repeat * len(inputs)) * 1000
+
+    def select(self, name, loaders: dict, default, inputs=None, run=None):
+        """
+        Load given model on the chosen backend
+        :param name: model name
+        :param loaders: {backend: function loading the model on that backend}
+        :param default: backend used when nothing is saved and autotune is disabled
+        :param inputs: function returning representative inputs, used by autotune
+        :param run: function(model, input) running inference, used by autotune
+        :return: (backend, model)
+        """
+
+        loaders = {b: loader for b, loader in loaders.items() if is_available(b)}
+        saved = ((self.config.get('models') or {}).get(name) or {}).get(self.host, {}).get('backend')
+        if saved in loaders:
+            model = self._load(name, saved, loaders[saved])
+            if model is not None:
+                logger.info(f"[Backends] {name} -> {saved} (saved)")
+                return saved, model
+
+        if self.autotune and len(loaders) > 1 and inputs is not None and run is not None:
+            samples = inputs()
+            timings, models = {}, {}
+            for backend, loader in loaders.items():
+                model = self._load(name, backend, loader)
+                if model is None:
+                    continue
+                try:
+                    timings[backend] = round(self.benchmark(model, samples, run), 3)
+                    models[backend] = model
+                except Exception as e:
+                    logger.warning(f"[Backends] {name} failed on {backend}: {e}")
+            if timings:
+                backend = min(timings, key=timings.get)
+                logger.info(f"[Backends] {name} timings (ms): {timings} -> {backend}")
+                self._save(name, backend, timings)
+                return backend, models[backend]
+
+        if default not in loaders:
+            default = next(iter(loaders))
+        logger.info(f"[Backends] {name} -> {default}")
+        return default, loaders[default]()
+
+
+selector = BackendSelector()
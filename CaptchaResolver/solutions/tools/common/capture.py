@@ -0,0 +1,112 @@
+import logging
+import os
+import queue
+import random
+import threading
+import uuid
+from datetime import datetime
+
+from . import metrics
+from .pack import PackWriter
+
+logger = logging.getLogger(__name__)
+metrics.REGISTRY.describe('resolver_debugger_captures_total', 'Debugger captures by result, written or dropped')
+
+
+class CaptureWriter:
+    """
+    Save debugger captures on a background thread so that disk writes stay out of the request latency
+    Captures are appended to packs (raw images + index, see PackWriter) which are rotated by size and count
+    """
+
+    POLICIES = ('drop_oldest', 'sample')
+
+    def __init__(self, directory, queue_size=256, policy='drop_oldest', sample_rate=1.0, max_bytes=256 * 1024 * 1024,
+                 max_count=10000):
+        """
+        :param directory: where packs are written
+        :param queue_size: max captures waiting to be written
+        :param policy: drop_oldest: a full queue drops its oldest capture to keep the new one
+                       sample: keep only sample_rate of captures, a full queue drops the new capture
+        :param sample_rate: fraction of captures to keep with sample policy
+        :param max_bytes: rotate pack when its images exceed this size
+        :param max_count: rotate pack when it contains this many captures
+        """
+
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy {policy}, choose from {self.POLICIES}")
+        self.directory = directory
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.dropped = 0
+        self.written = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._thread = threading.Thread(target=self._run, name='debugger-capture-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, data):
+        """ Queue capture for writing, never blocks """
+        if self.policy == 'sample' and random.random() >= self.sample_rate:
+            return False
+        while True:
+            try:
+                self._queue.put_nowait(data)
+                return True
+            except queue.Full:
+                if self.policy != 'drop_oldest':
+                    self._drop()
+                    return False
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._drop()
+            except queue.Empty:
+                pass
+
+    def _drop(self):
+        with self._lock:
+            self.dropped += 1
+            dropped = self.dropped
+        metrics.inc('resolver_debugger_captures_total', result='dropped')
+        if dropped == 1 or dropped % 100 == 0:
+            logger.warning(f"[Debugger] Capture queue is full, {dropped} captures dropped so far")
+
+    def _rotate(self):
+        if self._writer is not None:
+            self._writer.close()
+            logger.info(f"[Debugger] Rotated {self._writer.path} with {self._writer.count} captures")
+        name = f"captures-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._writer = PackWriter(os.path.join(self.directory, name))
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            try:
+                if data is None:
+                    break
+                if self._writer is None or self._writer.size >= self.max_bytes or self._writer.count >= self.max_count:
+                    self._rotate()
+                self._writer.append(data)
+                self._writer.flush()
+                self.written += 1
+                metrics.inc('resolver_debugger_captures_total', result='written')
+            except Exception as e:
+                logger.exception(f"[Debugger] Failed to write capture: {e}")
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """ Wait until every queued capture is written """
+        self._queue.join()
+
+    def close(self):
+        """ Write queued captures and stop the writer """
+        self._queue.put(None)
+        self._thread.join()
+        if self._writer is not None:
+            self._writer.close()
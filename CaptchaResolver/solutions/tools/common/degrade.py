@@ -0,0 +1,103 @@
+"""
+Load-adaptive degradation of expensive models
+
+Each model family lists cheaper fallback tiers, the controller moves every family one tier down when queue wait or cpu
+utilization crosses its enter threshold and one tier up once both are back under the exit thresholds, staying at least
+`hold` seconds in a tier so that it does not flap
+"""
+
+import logging
+import os
+import threading
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+metrics.REGISTRY.describe('resolver_degradation_level', 'Current degradation level, 0 is full accuracy')
+metrics.REGISTRY.describe('resolver_tier_requests_total', 'Requests served by each tier of each model family')
+
+FULL_TIER = {'name': 'full'}
+
+
+class LoadMonitor:
+    """Queue wait (EWMA) reported by the admission queue and cpu utilization of the host"""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.queue_wait = 0.0
+        self._cpu_times = None
+
+    def record_queue_wait(self, seconds):
+        self.queue_wait += self.alpha * (seconds - self.queue_wait)
+
+    def cpu(self):
+        """ Utilization between 0 and 1 since previous call """
+        if os.path.exists('/proc/stat'):
+            with open('/proc/stat', 'r') as f:
+                fields = [int(x) for x in f.readline().split()[1:]]
+            idle, total = fields[3] + fields[4], sum(fields)
+            previous, self._cpu_times = self._cpu_times, (idle, total)
+            if previous is None or total == previous[1]:
+                return 0.0
+            return 1 - (idle - previous[0]) / (total - previous[1])
+        if hasattr(os, 'getloadavg'):
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        return 0.0
+
+
+load = LoadMonitor()
+
+
+class DegradationController:
+    """Choose the tier serving each model family from the current load"""
+
+    def __init__(self, config):
+        """
+        :param config: function returning the degradation config::
+            interval: seconds between two load checks
+            hold: min seconds between two level changes
+            enter: {queue_wait: seconds, cpu: 0-1}, go one level down when any of them is crossed
+            exit: {queue_wait: seconds, cpu: 0-1}, go one level up when all of them are under
+            families: {family: [tier, ...]}, tiers from the first fallback to the cheapest one
+        """
+
+        self.config = config
+        self.level = 0
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._changed_at = 0.0
+
+    def _update(self, config):
+        now = time.monotonic()
+        if now - self._checked_at < config.get('interval', 1.0):
+            return
+        self._checked_at = now
+        signals = {'queue_wait': load.queue_wait, 'cpu': load.cpu()}
+        enter, exit_ = config.get('enter') or {}, config.get('exit') or {}
+        max_level = max((len(tiers) for tiers in (config.get('families') or {}).values()), default=0)
+        level = self.level
+        if any(signals[k] > v for k, v in enter.items() if k in signals):
+            level = min(level + 1, max_level)
+        elif all(signals[k] < v for k, v in exit_.items() if k in signals):
+            level = max(level - 1, 0)
+        if level != self.level and now - self._changed_at >= config.get('hold', 10):
+            logger.warning(f"[Degradation] Level {self.level} -> {level} | queue wait: {signals['queue_wait']:.2f}s"
+                           f" | cpu: {signals['cpu']:.0%}")
+            self.level, self._changed_at = level, now
+            metrics.gauge('resolver_degradation_level', level)
+
+    def tier(self, family):
+        """
+        Tier serving given family now
+        :return: {'name': 'full'} or the tier dict of the family config
+        """
+
+        config = self.config() or {}
+        with self._lock:
+            self._update(config)
+            level = self.level
+        tiers = (config.get('families') or {}).get(family) or []
+        tier = tiers[min(level, len(tiers)) - 1] if level and tiers else FULL_TIER
+        metrics.inc('resolver_tier_requests_total', family=family, tier=tier['name'])
+        return tier
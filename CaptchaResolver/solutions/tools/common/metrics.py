@@ -0,0 +1,224 @@
+"""
+Lightweight instrumentation of the resolver, exported in prometheus text format on /metrics
+
+Usage::
+    with metrics.request_context(type='recaptcha', grid='3x3', label='bus'):
+        with metrics.span('decode'):
+            ...
+
+    @metrics.timed('forward')
+    def predict(...):
+        ...
+
+Set environment variable RESOLVER_METRICS=0 to disable it, spans are then no-ops
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('RESOLVER_METRICS', '1') != '0'
+STAGE_LABELS = ('type', 'grid', 'label', 'stage')
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread safe store of all histograms, counters and gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def observe(self, name, labels: tuple, value):
+        """ labels is a tuple of (key, value) pairs """
+        with self._lock:
+            histogram = self.histograms.setdefault((name, labels), Histogram())
+            histogram.observe(value)
+
+    def inc(self, name, labels: tuple = (), value=1):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def set(self, name, labels: tuple = (), value=0):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    def add(self, name, labels: tuple = (), value=1):
+        with self._lock:
+            self.gauges[(name, labels)] = self.gauges.get((name, labels), 0) + value
+
+    def snapshot(self, name):
+        """ {labels: (sum, count)} of given histogram """
+        with self._lock:
+            return {labels: (h.sum, h.count) for (n, labels), h in self.histograms.items() if n == name}
+
+    def render(self):
+        """ Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+
+        def header(name, kind):
+            if self.help.get(name):
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        previous = None
+        for (name, labels), histogram in histograms:
+            if name != previous:
+                header(name, 'histogram')
+                previous = name
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            previous = None
+            for (name, labels), value in items:
+                if name != previous:
+                    header(name, kind)
+                    previous = name
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+REGISTRY = Registry()
+REGISTRY.describe('resolver_stage_seconds', 'Time spent in each stage of a resolve request')
+REGISTRY.describe('resolver_requests_in_flight', 'Resolve requests currently being processed')
+REGISTRY.describe('resolver_model_load_seconds', 'Time taken to load each model')
+REGISTRY.describe('resolver_cache_requests_total', 'Cache lookups by cache and result')
+_context = threading.local()
+
+
+@contextmanager
+def request_context(**labels):
+    """ Labels (type, grid, label) of the request processed by current thread, they are attached to every span """
+    if not ENABLED:
+        yield
+        return
+    previous = getattr(_context, 'labels', None)
+    _context.labels = {k: labels.get(k, '') or '' for k in STAGE_LABELS[:-1]}
+    REGISTRY.add('resolver_requests_in_flight', (), 1)
+    try:
+        yield
+    finally:
+        REGISTRY.add('resolver_requests_in_flight', (), -1)
+        _context.labels = previous
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        labels = getattr(_context, 'labels', None) or {}
+        key = tuple((k, labels.get(k, '')) for k in STAGE_LABELS[:-1]) + (('stage', self.stage),)
+        REGISTRY.observe('resolver_stage_seconds', key, time.perf_counter() - self.start)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage):
+    """ Time the block as given stage of current request """
+    return _Span(stage) if ENABLED else _NO_SPAN
+
+
+def timed(stage):
+    """ Decorate function so that every call is timed as given stage """
+
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def model_loaded(model, seconds):
+    """ Record time taken to load given model """
+    if ENABLED:
+        REGISTRY.set('resolver_model_load_seconds', (('model', model),), round(seconds, 6))
+
+
+def inc(name, **labels):
+    """ Increment given counter """
+    if ENABLED:
+        REGISTRY.inc(name, tuple(labels.items()))
+
+
+def observe(name, value, **labels):
+    """ Record value in given histogram """
+    if ENABLED:
+        REGISTRY.observe(name, tuple(labels.items()), value)
+
+
+def gauge(name, value, **labels):
+    """ Set given gauge """
+    if ENABLED:
+        REGISTRY.set(name, tuple(labels.items()), value)
+
+
+def cache_lookup(cache, hit: bool):
+    """ Record a hit or miss of given cache """
+    if ENABLED:
+        REGISTRY.inc('resolver_cache_requests_total', (('cache', cache), ('result', 'hit' if hit else 'miss')))
@@ -0,0 +1,138 @@
+import base64
+import glob
+import json
+import mmap
+import os
+
+IMAGE_KEYS = ('image', 'images')
+
+
+def load_captures(directory):
+    """
+    Read all debugger captures (json files) from the given directory
+    :param directory: path to captures, i.e: debugger/json
+    :return: list of request data as they were posted to resolver
+    """
+
+    captures = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'r') as f:
+            captures.append(json.load(f))
+    return captures
+
+
+class PackWriter:
+    """
+    Append-only packed corpus of resolver requests::
+        <path>.pack: raw image bytes, one after another
+        <path>.idx: one json line per request, request data without images and [offset, length] of its images
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._pack = open(f"{path}.pack", 'ab')
+        self._idx = open(f"{path}.idx", 'a+')
+        self._idx.seek(0)
+        self.count = sum(1 for _ in self._idx)
+
+    @property
+    def size(self):
+        """ Size of packed images in bytes """
+        return self._pack.tell()
+
+    def append(self, data):
+        """ Append request data to corpus, base64 images are stored as raw bytes """
+        record = {k: v for k, v in data.items() if k not in IMAGE_KEYS}
+        key = 'image' if data.get('image') is not None else 'images'
+        b64_images = [data[key]] if key == 'image' else data.get(key) or []
+        spans = []
+        for b64_img in b64_images:
+            raw = base64.b64decode(b64_img)
+            spans.append([self._pack.tell(), len(raw)])
+            self._pack.write(raw)
+        record['_key'] = key
+        record['_images'] = spans
+        self._idx.write(json.dumps(record) + '\n')
+        self.count += 1
+
+    def flush(self):
+        self._pack.flush()
+        self._idx.flush()
+
+    def close(self):
+        self._pack.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PackReader:
+    """ Memory-mapped reader of the corpus written by PackWriter, images are only touched when a request is read """
+
+    def __init__(self, path):
+        self.path = path.removesuffix('.idx').removesuffix('.pack')
+        with open(f"{self.path}.idx", 'r') as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self._file = open(f"{self.path}.pack", 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(
+            f"{self.path}.pack") else b''
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        """ Request data as it was posted to resolver """
+        record = self.records[i]
+        data = {k: v for k, v in record.items() if not k.startswith('_')}
+        images = [base64.b64encode(raw).decode('ascii') for raw in self.images(i)]
+        data[record['_key']] = images[0] if record['_key'] == 'image' else images
+        return data
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def images(self, i):
+        """ Raw image bytes of i'th request """
+        return [bytes(self._mmap[offset:offset + length]) for offset, length in self.records[i]['_images']]
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+
+class Corpus:
+    """
+    Requests from a captures directory, a directory of packs or a single pack
+    Packed requests are read lazily from their memory map on indexing
+    """
+
+    def __init__(self, path):
+        """
+        :param path: debugger/json or path of <name>.idx
+        """
+
+        if os.path.isdir(path):
+            self.parts = [load_captures(path)] + [PackReader(idx) for idx in sorted(glob.glob(os.path.join(path, '*.idx')))]
+        else:
+            self.parts = [PackReader(path)]
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __getitem__(self, i):
+        for part in self.parts:
+            if i < len(part):
+                return part[i]
+            i -= len(part)
+        raise IndexError('Corpus index out of range')
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
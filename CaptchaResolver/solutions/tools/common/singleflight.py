@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+from . import metrics
+from .admission import Expired
+
+logger = logging.getLogger(__name__)
+metrics.REGISTRY.describe('resolver_coalesced_total', 'Requests by single-flight role: leader computed, follower shared '
+                                                      'the result of a leader, timeout gave up waiting and computed, '
+                                                      'expired reached its deadline while waiting')
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical requests in flight: the first one (leader) computes, the ones arriving while it runs (followers)
+    wait for its result instead of computing it again
+    """
+
+    def __init__(self, max_wait=10.0):
+        """
+        :param max_wait: max seconds a follower waits for its leader before computing the result itself
+        """
+
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, deadline=None):
+        """
+        Result of fn() shared by every call with the same key in flight
+        :param deadline: time.monotonic() deadline of the caller, a follower waits for its leader until then at most
+        :raise Expired: if the deadline passed while waiting for the leader
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            metrics.inc('resolver_coalesced_total', role='leader')
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+
+        timeout = self.max_wait if deadline is None else max(0.0, min(deadline - time.monotonic(), self.max_wait))
+        if call.event.wait(timeout):
+            metrics.inc('resolver_coalesced_total', role='follower')
+            if call.error is not None:
+                raise call.error
+            return call.result
+        if deadline is not None and time.monotonic() >= deadline:
+            # The client gave up, computing now would only load the workers
+            metrics.inc('resolver_coalesced_total', role='expired')
+            raise Expired(f"Deadline passed while waiting {timeout:.2f}s for the leader")
+        logger.info(f"[SingleFlight] Leader still running after {timeout:.2f}s, computing independently")
+        metrics.inc('resolver_coalesced_total', role='timeout')
+        return fn()
@@ -139,6 +139,17 @@ def base64_to_cv2(b64_str):
     return np.asarray(base64_to_pil(b64_str))   # noqa
 
 
+def base64_to_bgr(b64_str):
+    """ Convert base64 string to BGR cv2 image whatever its mode (RGBA, RGB, grayscale or palette) """
+    img = base64_to_pil(b64_str)
+    if img.mode not in ('RGBA', 'RGB', 'L'):
+        img = img.convert('RGBA')
+    img = np.asarray(img)   # noqa
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR if img.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+
+
 def pil_to_bytes(img):
     """ Convert pil image to bytes string """
     img_byte_arr = io.BytesIO()
@@ -1,9 +1,9 @@
 import logging
 import socket
 import time
+from queue import Empty
 from threading import Thread
 
-import requests
 from selenium.webdriver.support.wait import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
@@ -104,11 +104,15 @@ class TokenAPI:
         try:
             self.driver.get(f"http://{self.domain}")
             captcha_solver = self.recaptcha_solver if self.type == 'recaptcha-v2' else self.hcaptcha_solver
+            tokens = self.harvester_server.get_token_queue(self.domain)
             while True:
-                if captcha_solver.solve() or requests.get(f"http://{self.host}:{self.port}/{self.domain}/tokens").json():
-                    return requests.get(f"http://{self.host}:{self.port}/{self.domain}/tokens").json()[0]
-                else:
-                    self.driver.refresh()
+                if captcha_solver.solve() or not tokens.empty():
+                    # The page sends the token in background once the widget callback fires
+                    try:
+                        return tokens.get(timeout=5)
+                    except Empty:
+                        pass
+                self.driver.refresh()
         except SELENIUM_EXCEPTIONS:
             return 'WEBDRIVER_EXCEPTION'
 
@@ -29,6 +29,10 @@ session_id = uuid.uuid4()
 
 log = logging.getLogger('harvester')
 
+BOOTSTRAP_CSS = ("<link rel='stylesheet' href='https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css' "
+                 "integrity='sha384-JcKb8q3iqJ61gNV9KGb8thSsNjpSL0n8PARn9HuZOnIxN0hoP+VmmDGMN5t9UJ0Z' "
+                 "crossorigin='anonymous'>")
+
 
 class DomainInvalidException(Exception):
     pass
@@ -53,7 +57,10 @@ __dir__ = path.join(getattr(sys, '_MEIPASS'), 'harvester', 'server') if getattr(
     sys, '_MEIPASS', None) else path.abspath(path.dirname(__file__))
 
 
-def ProxyHTTPRequestHandlerWrapper(domain_cache: Dict[str, MITMRecord] = {}, do_not_track=False):
+def ProxyHTTPRequestHandlerWrapper(domain_cache: Dict[str, MITMRecord] = {}, do_not_track=False, inline_submit=True,
+                                   external_css=False, analytics=False):
+    stylesheets = BOOTSTRAP_CSS if external_css else ''
+
     class ProxyHTTPRequestHandler(BaseHTTPRequestHandler):
         config: MITMRecord
         domain: str
@@ -105,17 +112,33 @@ def ProxyHTTPRequestHandlerWrapper(domain_cache: Dict[str, MITMRecord] = {}, do_
                 domain_list = ''
                 for domain in domain_cache.keys():
                     domain_list += f'<li class="list-group-item"><a href="http://{domain}">{domain}</a></li>'
-                self._render_template('domains.html', domain_list=domain_list)
+                self._render_template('domains.html', domain_list=domain_list, stylesheets=stylesheets)
             else:
                 self.handel_request('GET')
 
         def do_POST(self):
             self.handel_request('POST')
 
+        def _submit_token(self):
+            """Token sent as {"token": "..."} by the widget callback of an inline page"""
+            length = int(self.headers.get('content-length') or 0)
+            try:
+                token = json.loads(self.rfile.read(length) or b'{}').get('token')
+            except (ValueError, AttributeError):
+                token = None
+            if not token:
+                self.send_error(400, 'No token', 'Body must be a JSON object like {"token": "..."}')
+                return
+            self.config.tokens.put(token)
+            self._simple_headers(200, 'application/json; charset=utf-8')
+            self.wfile.write(json.dumps({'tokens': self.config.tokens.qsize()}).encode('utf-8'))
+
         def handel_request(self, method: str):
             if self._find_config():
                 host, port = self.server.server_address
-                if self.path == '/':
+                if self.path == '/submit' and method == 'POST':
+                    self._submit_token()
+                elif self.path == '/':
                     ga_config = dict(
                         do_not_track=str(do_not_track).lower(),
                         captcha=self.config.kind.value,
@@ -146,10 +169,14 @@ def ProxyHTTPRequestHandlerWrapper(domain_cache: Dict[str, MITMRecord] = {}, do_
                     html_config = dict(
                         domain=self.domain,
                         sitekey=self.config.sitekey,
-                        server=f"http://{host}:{port}")
+                        server=f"http://{host}:{port}",
+                        stylesheets=stylesheets)
 
                     html_config['script.ga.js'] = self._load_template(
-                        'ga.chunk.html', **ga_config)
+                        'ga.chunk.html', **ga_config) if analytics else ''
+                    html_config['script.submit.js'] = self._load_template(
+                        'inline.chunk.html' if inline_submit else 'form.chunk.html',
+                        widget='hcaptcha' if self.config.kind == CaptchaKindEnum.HCAPTCHA else 'grecaptcha')
 
                     if self.config.kind == CaptchaKindEnum.RECAPTCHA_V3:
                         html_config['action'] = self.config.data_action
@@ -186,10 +213,19 @@ def ProxyHTTPRequestHandlerWrapper(domain_cache: Dict[str, MITMRecord] = {}, do_
 
 
 class Harvester(object):
-    def __init__(self, host='127.0.0.1', port=5000, do_not_track=False):
+    def __init__(self, host='127.0.0.1', port=5000, do_not_track=False, inline_submit=True, external_css=False,
+                 analytics=False):
+        """
+        :param inline_submit: widget callbacks send tokens to /submit and reset the widget, so one page load harvests
+            many tokens, otherwise every token is posted with the form and the page reloaded
+        :param external_css: load bootstrap from its CDN
+        :param analytics: include the google analytics snippet, do_not_track disables it
+        """
+
         self.domain_cache: Dict[str, MITMRecord] = {}
         self.httpd = ThreadingHTTPServer(
-            (host, port), ProxyHTTPRequestHandlerWrapper(self.domain_cache, do_not_track))
+            (host, port), ProxyHTTPRequestHandlerWrapper(self.domain_cache, do_not_track, inline_submit,
+                                                         external_css, analytics))
 
     def serve(self):
         try:
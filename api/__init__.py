@@ -1,12 +1,16 @@
+import asyncio
 import logging
 import os
-import shutil
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
-from .solutions.exceptions import InvalidCaptchaTypeException
+from .solutions.exceptions import InvalidCaptchaTypeException, InvalidStorageBackendException
 from .solutions.common import *
+from .solutions.resolver import ResolverClient
+from .solutions.storage import MemoryStorage, DirectoryStorage
 
 logger = logging.getLogger(__name__)
 
@@ -41,14 +45,20 @@ class CaptchaSolver(Selenium):
 
     ACTIVE_DIRECTORY = os.path.abspath(os.path.dirname(__file__))
     TEMP_STORAGE_PREFIX = os.path.join(ACTIVE_DIRECTORY, 'temp_cache')
+    # Threads of solve_in_executor shared by every solver, one per solve running
+    EXECUTOR_THREADS = int(os.environ.get('CAPTCHA_SOLVER_THREADS', 16))
+    _executor = None
+    _executor_lock = threading.Lock()
 
     def __init__(self, driver=None, timeout=60, destroy_storage=True, make_storage=True, make_storage_at=None,
                  image_getting_method='screenshot', callback_at: int = None, host='http://127.0.0.1:5000',
-                 hook_frame=None, challenge_frame=None, response_locator=None):
+                 hook_frame=None, challenge_frame=None, response_locator=None, storage_backend='memory'):
         super().__init__()
         self.HOST = host
+        self.resolver = ResolverClient.of(host, budget=timeout)
         self.CHALLENGE_RUNNING = False
         self.RESPONSE = None
+        self.ROUNDS = []    # timing record of every round of the last recaptcha solved, see RecaptchaUtils.run_rounds
 
         self.driver = driver
         self.timeout = timeout
@@ -59,6 +69,10 @@ class CaptchaSolver(Selenium):
         self.make_storage = make_storage
         self.make_storage_at = make_storage_at
         self.destroyer = destroy_storage
+        if storage_backend not in ('memory', 'directory'):
+            raise InvalidStorageBackendException(f"Unknown storage backend {storage_backend}\n"
+                                                 " choose `memory` or `directory`")
+        self.storage_backend = storage_backend
 
         self.next_locator = None
         self.image_getting_method = image_getting_method
@@ -120,15 +134,17 @@ class CaptchaSolver(Selenium):
         return self
 
     def create_storage(self):
-        """Create temporary storage"""
+        """Create temporary storage, in memory unless directory backend is selected"""
+        if self.storage_backend == 'memory':
+            self.storage = MemoryStorage()
+            return
         if self.make_storage_at is None:
             self.make_storage_at = os.path.join(os.path.dirname(__file__), "temp_cache")
-        self.storage = os.path.join(self.make_storage_at, str(uuid.uuid4()))
-        os.makedirs(self.storage)
+        self.storage = DirectoryStorage(os.path.join(self.make_storage_at, str(uuid.uuid4())))
 
     def destroy_storage(self):
         """Destroy temporary storage"""
-        shutil.rmtree(self.storage, ignore_errors=True)
+        self.storage.destroy()
 
     def find_frames(self, secs: float or int = None, exception=False):
         """Find frames for recaptcha and hcaptcha"""
@@ -228,22 +244,24 @@ class CaptchaSolver(Selenium):
                 self.HOOK_FRAMES = [self._HOOK_FRAME]
                 self.CHALLENGE_FRAMES = [self._CHALLENGE_FRAME]
             if self.type == 'recaptcha_v2':
-                self.RESPONSE = self.recaptcha_v2.RecaptchaV2(self.HOST, self.driver, self.wait, self.timeout,
-                                                              self.HOOK_FRAMES,
-                                                              self.CHALLENGE_FRAMES, self.storage, self.image_getting_method,
-                                                              self.next_locator, self.callback_module, self.callback_at,
-                                                              self.response_locator,
-                                                              *args, **kwargs).solve()
+                challenger = self.recaptcha_v2.RecaptchaV2(self.resolver, self.driver, self.wait, self.timeout,
+                                                           self.HOOK_FRAMES,
+                                                           self.CHALLENGE_FRAMES, self.storage, self.image_getting_method,
+                                                           self.next_locator, self.callback_module, self.callback_at,
+                                                           self.response_locator,
+                                                           *args, **kwargs)
+                self.RESPONSE = challenger.solve()
+                self.ROUNDS = challenger.rounds
             elif self.type == 'recaptcha_v3':
                 self.RESPONSE = self.recaptcha_v3.RecaptchaV3().solve()
             elif self.type == 'hcaptcha':
-                self.RESPONSE = self.hcaptcha.Hcaptcha(self.HOST, self.driver, self.wait, self.HOOK_FRAMES,
+                self.RESPONSE = self.hcaptcha.Hcaptcha(self.resolver, self.driver, self.wait, self.HOOK_FRAMES,
                                                        self.CHALLENGE_FRAMES, self.storage, self.image_getting_method,
                                                        self.next_locator, self.callback_module, self.callback_at,
                                                        *args, **kwargs).solve()
 
         elif self.type == "antibot_links":
-            self.RESPONSE = self.antibot.AntiBotLinks(self.HOST, self.driver, self.wait, self.storage, *args, **kwargs).solve()
+            self.RESPONSE = self.antibot.AntiBotLinks(self.resolver, self.driver, self.wait, self.storage, *args, **kwargs).solve()
         elif self.type == 'gp_captcha':
             self.RESPONSE = self.gpcaptcha.GpCaptcha(self.driver, self.wait, self.timeout).solve()
         elif self.type == "new_captcha":
@@ -254,3 +272,34 @@ class CaptchaSolver(Selenium):
         logger.info(f"[CaptchaSolver] Type: {self.type} | Returned: {self.RESPONSE} |"
                     f" Time consumed {round(time.time() - start_time, 3)} seconds")
         return self.RESPONSE
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        """Bounded executor of solve_in_executor, EXECUTOR_THREADS threads shared by every solver"""
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.EXECUTOR_THREADS, thread_name_prefix='captcha-solver')
+            return cls._executor
+
+    async def solve_in_executor(self, *args, executor=None, **kwargs) -> bool:
+        """
+        Same as solve for asyncio callers, run on a pool thread so the event loop stays free while the solve runs
+        The whole solve runs on one thread of a bounded executor, its waits and resolver requests included, so at most
+        as many solves as executor threads run at once and the others queue. Cancelling the awaiting task wakes the
+        solve from its current wait and stops it
+        :param executor: executor running the solve, CaptchaSolver.executor() if None
+        """
+
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+
+        def run():
+            with cancel_scope(cancelled):
+                return self.solve(*args, **kwargs)
+
+        try:
+            return await loop.run_in_executor(executor or self.executor(), run)
+        except asyncio.CancelledError:
+            logger.info(f"[CaptchaSolver] Solving {self.type} cancelled")
+            cancelled.set()
+            raise
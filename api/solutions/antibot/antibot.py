@@ -1,10 +1,8 @@
-import urllib.request
 from collections import Counter
 from typing import Union, Any
 
-import requests
-
-from ..common import path_to_base64, indexN, argmin, Selenium, By, EC
+from ..common import indexN, argmin, Selenium, By, EC
+from ..resolver import ResolverClient
 
 
 class AntiBotLinks(Selenium):
@@ -13,7 +11,7 @@ class AntiBotLinks(Selenium):
                  object_image_locator=(By.XPATH, '//*[@class="alert alert-warning text-center"]/img'),
                  input_image_locator=(By.XPATH, '//div[@class="antibotlinks"]/a/img')):
         super().__init__()
-        self.HOST = host
+        self.HOST = ResolverClient.of(host)
         self.driver = driver
         self.wait = wait
         self.storage = storage
@@ -22,24 +20,23 @@ class AntiBotLinks(Selenium):
 
     def solve(self) -> Union[bool, list[Any]]:
         """Solve antibot_links patterns using machine learning model"""
-        paths = []
-        path_to_obj = f"{self.storage}/object.png"
+        names = ['object.png']
         obj_ref = self.wait.until(EC.presence_of_element_located(self.object_image_locator)).get_attribute("src")
-        urllib.request.urlretrieve(obj_ref, path_to_obj)
-        paths.append(path_to_obj)
+        self.storage.retrieve(obj_ref, 'object.png')
 
         # Download input image
         image_elm = self.wait.until(EC.presence_of_all_elements_located(self.input_image_locator))
         for i, x in enumerate(image_elm, 1):
-            path_to_image = f"{self.storage}/img{i}.png"
-            urllib.request.urlretrieve(x.get_attribute('src'), path_to_image)
-            paths.append(path_to_image)
+            self.storage.retrieve(x.get_attribute('src'), f"img{i}.png")
+            names.append(f"img{i}.png")
 
         # Solve images
-        images = [path_to_base64(p, encoding='ascii') for p in paths]
+        images = [self.storage.read_base64(n, encoding='ascii') for n in names]
         data = {'type': 'antibot', 'images': images}
-        response = requests.post(f"{self.HOST}/resolve", json=data)
+        response = self.HOST.post(data)
         res = response.json()['response']
+        if not res:
+            return False
         res = [(x[0], float(x[1])) for x in res]
         pred_obj, pred_inp = res[:3], res[3:]
         res_obj, score_obj = [x for x, y in pred_obj], [y for x, y in pred_obj]
@@ -0,0 +1,399 @@
+"""
+Client-side load balancing over several resolvers
+
+`CaptchaSolver(host=['http://10.0.0.1:5000', 'http://10.0.0.2:5000'])` (or a comma separated string) sends every request
+to the resolver with the fewest requests in flight, counting the ones waiting in its admission queue as reported by
+/ready. Resolvers failing failure_threshold requests in a row or reported not ready by the health probes are ejected,
+they get one trial request after cooldown seconds and are reinstated once it succeeds or a probe reports them ready.
+Resolve requests are idempotent, failed and shed requests are retried on another resolver while the budget allows.
+Every solver of the process listing the same resolvers shares one balancer, so that its loads, latencies, circuit
+breakers and health probes cover all of their requests, each solver only keeps its own budget (see BudgetedResolver)
+
+With the affinity policy requests of the same captcha type and label go to the same resolver, chosen on a consistent
+hash ring and skipped while it carries more than load_factor times the average load, so that every resolver keeps the
+models and caches of its own share of labels hot. Resolvers joining or leaving only move the labels of their share
+"""
+
+import bisect
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import weakref
+
+import requests
+
+from .resolver import ResolverClient
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('least_outstanding', 'ewma', 'affinity')
+POLICY = os.environ.get('RESOLVER_BALANCING', 'least_outstanding')
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+# Same as solutions.hcaptcha.label_tools of the resolver, prompts must map to the label the resolver solves
+BAD_CODE = {
+    "а": "a",
+    "е": "e",
+    "e": "e",
+    "i": "i",
+    "і": "i",
+    "ο": "o",
+    "с": "c",
+    "ԁ": "d",
+    "ѕ": "s",
+    "һ": "h",
+    "у": "y",
+    "р": "p",
+    "ー": "一",
+    "土": "士",
+}
+
+
+def label_cleaning(raw_label: str) -> str:
+    """cleaning errors-unicode"""
+    clean_label = raw_label
+    for c in BAD_CODE:
+        clean_label = clean_label.replace(c, BAD_CODE[c])
+    return clean_label
+
+
+def split_prompt_message(prompt_message: str) -> str:
+    """Detach label from challenge prompt"""
+    prompt_message = prompt_message.replace(".", "").lower()
+    if "containing" in prompt_message:
+        return re.split(r"containing a", prompt_message)[-1][1:].strip()
+    if "select all" in prompt_message:
+        return re.split(r"all (.*) images", prompt_message)[1].strip()
+    return prompt_message
+
+
+def affinity_key(data):
+    """
+    Captcha type and label of a request, None if it has no label
+    hCaptcha prompts are reduced to their label the way the resolver does, so every phrasing of a label has one key
+    """
+
+    if data.get('type') == 'hcaptcha' and data.get('prompt'):
+        label = label_cleaning(split_prompt_message(data['prompt']))
+    else:
+        label = (data.get('label') or '').strip().lower()
+    return f"{data.get('type')}:{label}" if label else None
+
+
+TRANSPORT_ERRORS = (requests.RequestException, OSError)
+
+
+class Endpoint:
+    """State of one resolver: requests in flight, latency estimate and circuit breaker"""
+
+    def __init__(self, client):
+        self.client = client
+        self.outstanding = 0
+        self.queue_depth = 0        # requests waiting in its admission queue at the last probe
+        self.latency = None         # EWMA of response times
+        self.failures = 0           # consecutive failures
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial = False          # trial request of a half open endpoint in flight
+
+    def __str__(self):
+        return str(self.client)
+
+
+class BalancedResolver(ResolverClient):
+    """
+    Same interface as ResolverClient, requests are spread over several resolvers
+    Policies::
+        least_outstanding: fewest requests in flight plus queued on the resolver, lowest latency on ties
+        ewma: lowest latency EWMA weighted by the requests in flight plus queued on the resolver
+        affinity: resolver of the type and label of the request on the hash ring unless it is over its bounded load,
+                  least_outstanding for requests without label
+    """
+
+    def __init__(self, hosts, budget=None, policy=POLICY, retries=2, failure_threshold=3, cooldown=30.0,
+                 probe_interval=10.0, probe_timeout=2.0, alpha=0.3, load_factor=1.25, replicas=64):
+        """
+        :param hosts: resolver addresses or clients, see ResolverClient.of
+        :param budget: seconds the resolvers have to answer a request including its retries, no budget if None
+        :param policy: least_outstanding, ewma or affinity
+        :param retries: max other resolvers tried after a failed or shed request
+        :param failure_threshold: consecutive failures ejecting a resolver
+        :param cooldown: seconds before an ejected resolver gets a trial request
+        :param probe_interval: seconds between two health probes of every resolver, no probes if None
+        :param probe_timeout: seconds a resolver has to answer a health probe
+        :param alpha: smoothing of the latency estimate of every resolver
+        :param load_factor: max load of a resolver chosen by affinity, relative to the average load
+        :param replicas: points of every resolver on the hash ring
+        """
+
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown balancing policy {policy}, expected one of {POLICIES}")
+        self.endpoints = [Endpoint(ResolverClient.of(host)) for host in hosts]
+        super().__init__(','.join(str(e) for e in self.endpoints), budget)
+        self.load_factor = load_factor
+        self.replicas = replicas
+        self._ring = []
+        self._build_ring()
+        self.policy = policy
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._prober = None
+
+    @classmethod
+    def shared(cls, hosts):
+        """ Balancer of hosts shared by every solver of the process """
+        key = tuple(str(host).strip().rstrip('/') for host in hosts)
+        with _shared_lock:
+            if key not in _shared:
+                _shared[key] = cls(hosts)
+            return _shared[key]
+
+    def _build_ring(self):
+        """ Points of every resolver on the ring are hashed from its address, they do not move when others change """
+        self._ring = sorted(((_hash(f"{endpoint}#{i}"), str(endpoint), endpoint)
+                             for endpoint in self.endpoints for i in range(self.replicas)), key=lambda p: p[:2])
+        self._points = [point for point, *_ in self._ring]
+        self.host = ','.join(str(e) for e in self.endpoints)
+
+    def add(self, host):
+        """ Add a resolver, it takes over about 1/n of the labels of the others """
+        with self._lock:
+            self.endpoints.append(Endpoint(ResolverClient.of(host)))
+            self._build_ring()
+
+    def remove(self, host):
+        """ Remove a resolver, only its labels move to the others """
+        with self._lock:
+            self.endpoints = [e for e in self.endpoints if str(e) != str(ResolverClient.of(host))]
+            self._build_ring()
+
+    @staticmethod
+    def _load(endpoint):
+        return endpoint.outstanding + endpoint.queue_depth
+
+    def _affine(self, candidates, key):
+        """
+        First candidate clockwise from key on the ring whose load stays under load_factor times the average load
+        (consistent hashing with bounded loads), caller holds the lock
+        """
+
+        capacity = math.ceil(self.load_factor * (sum(map(self._load, candidates)) + 1) / len(candidates))
+        start = bisect.bisect(self._points, _hash(key))
+        for i in range(len(self._ring)):
+            endpoint = self._ring[(start + i) % len(self._ring)][2]
+            if endpoint in candidates and self._load(endpoint) < capacity:
+                return endpoint
+        return min(candidates, key=self._score)
+
+    def _score(self, endpoint):
+        load = self._load(endpoint)
+        if self.policy == 'ewma':
+            # Unmeasured resolvers score 0 so that each of them gets measured
+            return (endpoint.latency or 0.0) * (load + 1), load
+        return load, endpoint.latency or 0.0
+
+    def _acquire(self, exclude, key=None):
+        """
+        Best endpoint not in exclude with its outstanding requests incremented, None if every one is ejected
+        :param key: affinity key of the request
+        """
+
+        self._start_prober()
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint in exclude:
+                    continue
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown:
+                    endpoint.state = HALF_OPEN
+                if endpoint.state == CLOSED or (endpoint.state == HALF_OPEN and not endpoint.trial):
+                    candidates.append(endpoint)
+            if not candidates:
+                return None
+            if self.policy == 'affinity' and key is not None:
+                endpoint = self._affine(candidates, key)
+            else:
+                random.shuffle(candidates)  # spread ties
+                endpoint = min(candidates, key=self._score)
+            endpoint.trial = endpoint.state == HALF_OPEN
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _eject(self, endpoint, reason):
+        """ Caller holds the lock """
+        if endpoint.state != OPEN:
+            logger.warning(f"[Resolver] Ejecting {endpoint} for {self.cooldown}s: {reason}")
+        endpoint.state = OPEN
+        endpoint.opened_at = time.monotonic()
+
+    def _reinstate(self, endpoint):
+        """ Caller holds the lock """
+        if endpoint.state != CLOSED:
+            logger.info(f"[Resolver] Reinstating {endpoint}")
+        endpoint.state = CLOSED
+        endpoint.failures = 0
+
+    def _release(self, endpoint, outcome, elapsed, reason=None):
+        """
+        Record the outcome of a request
+        :param outcome: ok, shed (answered 503 Overloaded or Expired) or failed
+        """
+
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.trial = False
+            if outcome == 'ok':
+                endpoint.latency = elapsed if endpoint.latency is None else \
+                    endpoint.latency + self.alpha * (elapsed - endpoint.latency)
+                self._reinstate(endpoint)
+            elif outcome == 'shed':
+                # Saturated resolver, weighs as one more queued request until its next probe
+                endpoint.queue_depth += 1
+            elif outcome == 'failed':
+                endpoint.failures += 1
+                if endpoint.state == HALF_OPEN or endpoint.failures >= self.failure_threshold:
+                    self._eject(endpoint, reason)
+
+    @staticmethod
+    def _outcome(response):
+        if response.status_code < 500:
+            return 'ok'
+        try:
+            error = response.json().get('error')
+        except ValueError:
+            error = None
+        return 'shed' if error in ('Overloaded', 'Expired') else 'failed'
+
+    def _attempts(self, data, budget):
+        """ Yield the endpoint and remaining budget of every attempt of a request """
+        key = affinity_key(data) if self.policy == 'affinity' else None
+        budget = self.budget if budget is None else budget
+        end = time.monotonic() + budget if budget else None
+        tried = set()
+        for attempt in range(self.retries + 1):
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return
+            endpoint = self._acquire(tried, key)
+            if endpoint is None:
+                return
+            tried.add(endpoint)
+            if attempt:
+                logger.info(f"[Resolver] Retrying on {endpoint}, attempt {attempt + 1}")
+            yield endpoint, remaining
+
+    def _post(self, data, budget=None):
+        response = error = None
+        for endpoint, remaining in self._attempts(data, budget):
+            start = time.monotonic()
+            try:
+                response = endpoint.client.post(data, remaining)
+            except TRANSPORT_ERRORS as e:
+                error = e
+                self._release(endpoint, 'failed', time.monotonic() - start, e)
+                continue
+            outcome = self._outcome(response)
+            self._release(endpoint, outcome, time.monotonic() - start, f"status {response.status_code}")
+            if outcome == 'ok':
+                return response
+        return self._exhausted(response, error)
+
+    def _exhausted(self, response, error):
+        """ Last answer of a request no resolver answered, raise its last error if none answered at all """
+        if response is not None:
+            return response
+        if error is not None:
+            raise error
+        raise requests.ConnectionError(f"No resolver available among {self}")
+
+    def ready(self, timeout=2):
+        """ Ready if any resolver is, else None if any is unknown, queue_depth of the least loaded ready one """
+        payloads = [e.client.ready(timeout) for e in self.endpoints]
+        ready = [p for p in payloads if p.get('ready')]
+        if not ready and any(p.get('ready', False) is None for p in payloads):
+            return {'ready': None, 'queue_depth': 0}
+        return {'ready': bool(ready), 'queue_depth': min((p.get('queue_depth', 0) for p in ready), default=0)}
+
+    def probe(self):
+        """
+        Refresh queue depth of every resolver, eject the ones not ready and reinstate the ready ones
+        Resolvers reporting ready None (unknown) are left as they are
+        """
+        for endpoint in self.endpoints:
+            payload = endpoint.client.ready(self.probe_timeout)
+            with self._lock:
+                endpoint.queue_depth = payload.get('queue_depth', 0)
+                if payload.get('ready'):
+                    self._reinstate(endpoint)
+                elif payload.get('ready', False) is not None:
+                    self._eject(endpoint, payload.get('error') or 'not ready')
+
+    def _start_prober(self):
+        if self._prober is not None or not self.probe_interval:
+            return
+        with self._lock:
+            if self._prober is None:
+                # Probes hold a weak reference so that the balancer and its thread are freed once unused
+                self._prober = threading.Thread(target=self._probe_loop, args=(weakref.ref(self), self.probe_interval),
+                                                name='resolver-health-probe', daemon=True)
+                self._prober.start()
+
+    @staticmethod
+    def _probe_loop(ref, interval):
+        while True:
+            time.sleep(interval)
+            balancer = ref()
+            if balancer is None:
+                return
+            try:
+                balancer.probe()
+            except Exception as e:
+                logger.exception(f"[Resolver] Health probe failed: {e}")
+            del balancer
+
+
+class BudgetedResolver(ResolverClient):
+    """Client of one solver over a shared balancer, requests without budget get the budget of this client"""
+
+    def __init__(self, balancer, budget=None):
+        """
+        :param balancer: BalancedResolver, i.e: BalancedResolver.shared(hosts)
+        :param budget: seconds the resolvers have to answer a request of this client, no budget if None
+        """
+
+        # Connections and state are the ones of the balancer, no session of its own
+        self.balancer = balancer
+        self.budget = budget
+
+    def __str__(self):
+        return str(self.balancer)
+
+    @property
+    def host(self):
+        return self.balancer.host
+
+    def ready(self, timeout=2):
+        return self.balancer.ready(timeout)
+
+    def _post(self, data, budget=None):
+        return self.balancer.post(data, self.budget if budget is None else budget)
+
@@ -1,7 +1,9 @@
 import base64
 import logging
 import random
+import threading
 import time
+from contextlib import contextmanager
 from typing import List, Union, Callable, Tuple, Dict, Optional, Any
 
 import requests
@@ -18,12 +20,14 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.select import Select
 from selenium.webdriver.support.wait import WebDriverWait
 
+from .exceptions import SolveCancelled
+
 logging.getLogger('selenium').setLevel(logging.ERROR)
 logging.getLogger('urllib').setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
 __all__ = ['ActionChains', 'By', 'Options', 'EC', 'WebDriverWait', 'webdriver', 'Selenium', 'multiWait', 'Select',
-           'safe_request', 'indexN', 'path_to_base64', 'multiWaitNsec', 'argmax', 'argmin',
+           'safe_request', 'indexN', 'path_to_base64', 'multiWaitNsec', 'argmax', 'argmin', 'sleep', 'cancel_scope',
            # **Exceptions**
            'TimeoutException', 'ElementNotInteractableException', 'ElementNotVisibleException', 'ElementNotSelectableException',
            'ElementClickInterceptedException', 'StaleElementReferenceException', 'NoSuchElementException',
@@ -35,6 +39,28 @@ __all__ = ['ActionChains', 'By', 'Options', 'EC', 'WebDriverWait', 'webdriver',
            ]
 
 
+_context = threading.local()
+
+
+@contextmanager
+def cancel_scope(cancelled: threading.Event):
+    """ Waits of the current thread raise SolveCancelled once cancelled is set """
+    _context.cancelled = cancelled
+    try:
+        yield
+    finally:
+        _context.cancelled = None
+
+
+def sleep(secs):
+    """ time.sleep that wakes up and raises SolveCancelled as soon as the cancel scope of the thread is cancelled """
+    cancelled = getattr(_context, 'cancelled', None)
+    if cancelled is None:
+        time.sleep(secs)
+    elif cancelled.wait(secs):
+        raise SolveCancelled
+
+
 def argmax(list_: list) -> int:
     """ Maximum value index in given list """
     return list_.index(max(list_))
@@ -45,15 +71,23 @@ def argmin(list_) -> int:
     return list_.index(min(list_))
 
 
-def safe_request(src, headers=None, ignored_exceptions=(), on_error=None, image_path: str = None):
+def safe_request(src, headers=None, ignored_exceptions=(), on_error=None, image_path: str = None, storage=None):
+    """
+    Get src without raising ignored_exceptions
+    :param image_path: save the content at image_path instead of returning the response
+    :param storage: if given, image_path is the name of the content inside this storage
+    """
     try:
         response = requests.get(src, headers=headers)
     except ignored_exceptions:
         return on_error() if callable(on_error) else on_error
     else:
         if image_path is not None:
-            with open(image_path, 'wb') as f:
-                f.write(response.content)
+            if storage is not None:
+                storage.write(image_path, response.content)
+            else:
+                with open(image_path, 'wb') as f:
+                    f.write(response.content)
         else:
             return response
 
@@ -108,7 +142,7 @@ class Delay:
 
     def _sleep(self, secs):  # noqa
         logger.debug(f"[Delay] Sleeping for {secs} seconds")
-        time.sleep(secs)
+        sleep(secs)
 
     def one100_one1000(self):
         """Sleep Program for Random Between 0.001 - 0.01 seconds"""
@@ -233,7 +267,7 @@ class Selenium:
                 persistency = 0
             _prev_id = ID
             logger.info(f"[MultiWaitNSec] Visible locator: {locators[ID]} && Persistency: {persistency + 1} second")
-            time.sleep(1)
+            sleep(1)
             persistency += 1
         return ID
 
@@ -262,7 +296,7 @@ class Selenium:
         logger.debug('[Selenium] Scrolled into element')
         self.driver.execute_script("arguments[0].scrollIntoView({ behavior: 'smooth', block: 'center'});", element)
         for i in range(4):
-            time.sleep(1)
+            sleep(1)
             _scrollX = self.driver.execute_script("return window.scrollX")
             _scrollY = self.driver.execute_script("return window.scrollY")
             if (_scrollX != scrollX) or (_scrollY != scrollY):
@@ -315,7 +349,7 @@ def _multiWait(driver, locators, max_polls, output_type):
                         fkwds = {}
                     if func(*fargs, **fkwds):
                         return i
-                    time.sleep(1)
+                    sleep(1)
                 else:
                     ec = loc.get('ec')
                     if ec is None:
@@ -336,7 +370,7 @@ def _multiWait(driver, locators, max_polls, output_type):
                 if callable(loc):
                     if loc():
                         return i
-                    time.sleep(1)
+                    sleep(1)
                 else:
                     try:
                         element = wait.until(EC.presence_of_element_located(loc))
@@ -391,5 +425,5 @@ def multiWaitNsec(driver, locators, _time, timeout, refresh_url_every_n_sec=None
     for i in range(_time):
         ID = multiWait(driver, locators, timeout, refresh_url_every_n_sec=refresh_url_every_n_sec)
         logger.info(f"Visible locator: {locators[ID]} && Persistency: {i + 1} seconds")
-        time.sleep(1)
+        sleep(1)
     return ID
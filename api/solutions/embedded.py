@@ -0,0 +1,105 @@
+"""
+Embedded resolver for solvers running on the same machine as CaptchaResolver
+
+`CaptchaSolver(host='inproc://')` resolves challenges by calling the resolver in-process instead of posting them to
+/resolve: no JSON encoding, HTTP round trip or Flask parsing, images are decoded once by the resolver. The resolver is
+imported from RESOLVER_PATH (CaptchaResolver next to api by default) on the first request, its models and admission
+queue are shared by every solver of the process. Its readiness is unknown until then, `ready()` reports None
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+from .resolver import ResolverClient
+
+logger = logging.getLogger(__name__)
+
+INPROC = 'inproc://'
+RESOLVER_PATH = os.environ.get(
+    'RESOLVER_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  'CaptchaResolver'))
+
+_lock = threading.Lock()
+_intercept = None
+_admission = None
+
+
+def load():
+    """
+    Import the resolver once per process
+    :return: intercept function, None if resolver assets are missing, and the admission queue of the process
+    """
+
+    global _intercept, _admission
+    with _lock:
+        if _admission is None:
+            if RESOLVER_PATH not in sys.path:
+                sys.path.insert(0, RESOLVER_PATH)
+            logger.info(f"[Resolver] Loading embedded resolver from {RESOLVER_PATH}")
+            from solutions.tools.common.admission import AdmissionQueue
+            _admission = AdmissionQueue()
+        if _intercept is None:
+            from solutions.tools.common.assets import MissingAssetsError
+            try:
+                from intercept import intercept
+            except MissingAssetsError as e:
+                # Import is tried again by the next request, once assets are pulled
+                logger.error(f"[Resolver] Embedded resolver is not ready: {e}")
+            else:
+                _intercept = intercept
+                logger.info("[Resolver] Embedded resolver is ready")
+        return _intercept, _admission
+
+
+class EmbeddedResponse:
+    """Answer of the embedded resolver, same status_code and json() as the responses of /resolve"""
+
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class EmbeddedResolver(ResolverClient):
+    """
+    Same interface as ResolverClient, requests are resolved by the resolver imported in this process
+    The budget is applied by the admission queue of the process, requests it cannot answer in time are answered with
+    503 and {'response': False, 'error': 'Overloaded' or 'Expired'} as the resolver app does
+    """
+
+    def __init__(self, host=INPROC, budget=None, debugger=True):
+        """
+        :param host: inproc://
+        :param budget: seconds the resolver has to answer, default budget of the resolver if None
+        :param debugger: queue unsolved requests for the debugger captures of the resolver
+        """
+
+        super().__init__(host, budget)
+        self.host = host
+        self.debugger = debugger
+
+    def ready(self, timeout=2):
+        """ Unknown (None) until the first request loads the resolver, then whether it loaded """
+        return {'ready': None if _admission is None else _intercept is not None,
+                'queue_depth': _admission.depth if _admission is not None else 0}
+
+    def _post(self, data, budget=None):
+        intercept, admission = load()
+        if intercept is None:
+            return self._check(EmbeddedResponse({'response': False, 'error': 'NotReady'}, 503))
+
+        from solutions.tools.common.admission import Expired, Overloaded
+        budget = self.budget if budget is None else budget
+        try:
+            # intercept adds capture fields to data, keep the caller's dict untouched as over HTTP
+            results = admission.run(intercept, dict(data), self.debugger,
+                                    deadline=time.monotonic() + budget if budget else None,
+                                    kind=f"{data.get('type')}/{data.get('grid', '-')}")
+        except (Overloaded, Expired) as e:
+            return self._check(EmbeddedResponse({'response': False, 'error': type(e).__name__}, 503))
+        return EmbeddedResponse(results)
@@ -6,6 +6,10 @@ class InvalidImageGettingMethodException(Exception):
     pass
 
 
+class InvalidStorageBackendException(Exception):
+    pass
+
+
 class CannotSolveCaptcha(Exception):
     pass
 
@@ -16,3 +20,7 @@ class InvalidCaptchaTypeException(Exception):
 
 class GotDetectedException(Exception):
     pass
+
+
+class SolveCancelled(Exception):
+    pass
@@ -0,0 +1,150 @@
+import logging
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from .common import sleep
+
+logger = logging.getLogger(__name__)
+
+# Every frame predicate of the challengers, evaluated at once inside a frame or the top document
+PROBE_SCRIPT = '''(() => {
+    const visible = el => Boolean(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    const please = document.evaluate('//*[contains(text(), "Please")]', document, null,
+                                     XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    let retryPrompt = false;
+    for (let i = 0; i < please.snapshotLength; i++) {
+        retryPrompt = retryPrompt || visible(please.snapshotItem(i));
+    }
+    return {
+        recaptcha_checkbox: Boolean(document.getElementById('rc-anchor-container')),
+        hcaptcha_checkbox: Boolean(document.getElementById('anchor-tc')),
+        banner: Boolean(document.querySelector('strong') || document.getElementById('audio-instructions')),
+        label: Boolean(document.querySelector('.prompt-text')),
+        retry_prompt: retryPrompt,
+        response: Array.from(document.getElementsByName('g-recaptcha-response')).some(el => el.value !== '')
+    };
+})()'''
+
+# Probe of the document holding the frames, with whether the driver is in that document
+TOP_SCRIPT = f'return [arguments[0].every(f => f.ownerDocument === document), {PROBE_SCRIPT}]'
+
+
+class FrameProbe:
+    """
+    Evaluate every frame predicate of a challenge in one pass and return a status record
+
+    Every poll runs one script in the document holding the frames and one switch_to.frame plus one script per frame,
+    instead of one switch and one find_element per predicate. Challenge frames are cross-origin, so they cannot be read
+    from the top document
+    Record::
+        checkbox: a recaptcha or hcaptcha checkbox is in a hook frame
+        banner: recaptcha label banner or audio instructions are in a challenge frame
+        label: hcaptcha prompt text is in a challenge frame
+        retry_prompt: a "Please ..." prompt is visible in a challenge frame
+        response: g-recaptcha-response of the top document is filled
+        frames: {frame element id: record of that frame}
+    """
+
+    def __init__(self, driver, frames, ttl=0.5, poll=0.25):
+        """
+        :param frames: function returning the hook frames and the challenge frames to probe
+        :param ttl: seconds a record is reused by the predicates reading it
+        :param poll: seconds between two probes in wait
+        """
+
+        self.driver = driver
+        self.frames = frames
+        self.ttl = ttl
+        self.poll = poll
+        self._record = None
+        self._probed_at = 0.0
+
+    def evaluate(self, frame):
+        """ Record of one frame element, the driver is in the document holding it """
+        try:
+            self.driver.switch_to.frame(frame)
+        except WebDriverException:
+            return {}
+        try:
+            return self.driver.execute_script(f'return {PROBE_SCRIPT}')
+        except WebDriverException:
+            return {}
+        finally:
+            self.driver.switch_to.parent_frame()
+
+    def _top(self, frames):
+        """
+        Record of the document holding the frames
+        The driver is switched to the default content if it was left in another frame, i.e: a challenge frame
+        """
+
+        for attempt in range(2):
+            try:
+                holds, record = self.driver.execute_script(TOP_SCRIPT, frames)
+                if holds:
+                    return record
+            except WebDriverException:
+                pass
+            if not attempt:
+                logger.debug("[FrameProbe] Driver is not in the document of the frames, switching to default content")
+                self.driver.switch_to.default_content()
+        logger.warning("[FrameProbe] Frames are neither in the current document nor in the default content")
+        return {}
+
+    def status(self):
+        """ Status record of the hook frames, challenge frames and top document, reused for ttl seconds """
+        if self._record is not None and time.monotonic() - self._probed_at < self.ttl:
+            return self._record
+
+        hook_frames, challenge_frames = self.frames()
+        hook_frames = [f for f in hook_frames or [] if f is not None]
+        challenge_frames = [f for f in challenge_frames or [] if f is not None]
+        top = self._top(hook_frames + challenge_frames)
+        frames = {f.id: self.evaluate(f) for f in hook_frames + challenge_frames}
+        hooks = [frames[f.id] for f in hook_frames]
+        challenges = [frames[f.id] for f in challenge_frames]
+        self._record = {
+            'checkbox': any(r.get('recaptcha_checkbox') or r.get('hcaptcha_checkbox') for r in hooks),
+            'banner': any(r.get('banner') for r in challenges),
+            'label': any(r.get('label') for r in challenges),
+            'retry_prompt': any(r.get('retry_prompt') for r in challenges),
+            'response': bool(top.get('response')),
+            'frames': frames,
+        }
+        self._probed_at = time.monotonic()
+        return self._record
+
+    def frame(self, frame):
+        """ Record of one probed frame element, empty if it is not probed """
+        return self.status()['frames'].get(getattr(frame, 'id', None), {})
+
+    def invalidate(self):
+        self._record = None
+
+    def present(self, locator):
+        """ Predicate true once an element of locator, i.e: (By.ID, 'next'), is in the current document """
+        def predicate():
+            try:
+                return bool(self.driver.find_elements(*locator))
+            except WebDriverException:
+                return False
+
+        return predicate
+
+    def wait(self, predicates, timeout):
+        """
+        Same as multiWait for predicates reading the status record, all of them share one probe per poll
+        Entries that are not callable are locators, such as the next_locator of solve, see present
+        :raise TimeoutException: if none of them is true within timeout seconds
+        """
+
+        predicates = [p if callable(p) else self.present(p) for p in predicates]
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            self.invalidate()
+            for i, predicate in enumerate(predicates):
+                if predicate():
+                    return i
+            sleep(self.poll)
+        raise TimeoutException("None of the given predicates is true!")
@@ -3,6 +3,8 @@ from .precompiled_solution import hcaptcha
 import logging
 
 from ..exceptions import MaxRetryExceededException
+from ..frames import FrameProbe
+from ..resolver import ResolverClient
 
 logger = logging.getLogger(__name__)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [HcaptchaChallenger] - %(message)s')
@@ -15,7 +17,7 @@ class Hcaptcha(Selenium):
     def __init__(self, host, driver, wait, hook_frames, challenge_frames, storage, image_getting_method,
                  next_locator, callback_at, callback_module, *args, **kwargs):
         super().__init__()
-        self.HOST = host
+        self.HOST = ResolverClient.of(host)
         self.driver = driver
         self.wait = wait
 
@@ -36,10 +38,14 @@ class Hcaptcha(Selenium):
 
         self.args = args
         self.kwargs = kwargs
+        # Predicates below read one status record of every frame instead of switching to each of them
+        self.probe = FrameProbe(self.driver, lambda: ([self.HOOK_FRAME], self.CHALLENGE_FRAMES))
 
     def anti_checkbox(self):
         """ Click checkbox and return True else False """
 
+        if not self.probe.status()['checkbox']:
+            return False
         self.driver.switch_to.frame(self.HOOK_FRAME)
         try:
             self.driver.find_element(By.XPATH, '//*[@id="anchor-tc"]')
@@ -54,18 +60,7 @@ class Hcaptcha(Selenium):
     def is_label_visible(self):
         """Check whether label visible or not"""
 
-        for i, f in enumerate(self.CHALLENGE_FRAMES):
-            self.driver.switch_to.frame(f)
-            try:
-                self.driver.find_element(By.CLASS_NAME, 'prompt-text')
-            except NoSuchElementException:
-                pass
-            else:
-                return True
-            finally:
-                self.driver.switch_to.parent_frame()
-            if i == len(self.CHALLENGE_FRAMES) - 1:
-                return False
+        return self.probe.status()['label']
 
     def is_challenge_solved(self):
         """Check whether challenge solved or not"""
@@ -115,7 +110,8 @@ class Hcaptcha(Selenium):
     def _solve(self, retries=10):
         challenger = self.hcaptcha_challenger.new_challenger(self.HOST, self.driver, self.HOOK_FRAME, self.CHALLENGE_FRAME,
                                                              self.next_locator, self.image_getting_method,
-                                                             debug=True, dir_workspace=self.storage)
+                                                             debug=True,
+                                                             dir_workspace=getattr(self.storage, 'directory', None))
         for r in range(retries):
             try:
                 if (_resp := challenger.anti_hcaptcha()) is None:
@@ -142,9 +138,11 @@ class Hcaptcha(Selenium):
 
         self.real_hook_frame()
         response = False
-        response_id = multiWait(self.driver, [self.anti_checkbox, self.is_label_visible, self.is_challenge_solved, self.next_locator], 30)
+        response_id = self.probe.wait([self.anti_checkbox, self.is_label_visible, self.is_challenge_solved,
+                                       self.next_locator], 30)
         if response_id == 0:
-            response_id = multiWait(self.driver, [lambda: 1 == 2, self.is_label_visible, self.is_challenge_solved, self.next_locator], 30)
+            response_id = self.probe.wait([lambda: 1 == 2, self.is_label_visible, self.is_challenge_solved,
+                                           self.next_locator], 30)
         if response_id == 1:
             self.real_challenge_frame()
             if self._solve():
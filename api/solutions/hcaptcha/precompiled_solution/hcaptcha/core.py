@@ -1,18 +1,36 @@
+import base64
 import os
 import random
 import re
-import shutil
 import time
 import typing
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import quote
 from urllib.request import getproxies
 
 import requests
+from requests.adapters import HTTPAdapter
 from loguru import logger
 
 from .exceptions import LabelNotFoundException, ChallengePassed, ChallengeLangException
 from ....common import *
 
+# Per-image timeout (seconds) of the in-memory challenge image downloader
+DOWNLOAD_TIMEOUT = 5
+DOWNLOAD_WORKERS = 32
+
+# Shared by every challenger so that connections to the image CDN are kept alive between rounds
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_WORKERS))
+_downloader = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="hcaptcha-downloader")
+
+
+def _fetch_image(url: str, timeout: float) -> bytes:
+    """Fetch single challenge image into memory"""
+    response = _session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
 
 class HolyChallenger:
     """hCAPTCHA challenge drive control"""
@@ -141,8 +159,8 @@ class HolyChallenger:
         self.alias2locator = {}
         # Store the `download link` of the challenge image {挑战图片1: url1, ...}
         self.alias2url = {}
-        # Store the `directory` of challenge image {挑战图片1: "/images/挑战图片1.png", ...}
-        self.alias2path = {}
+        # Store the `content` of challenge image {挑战图片1: b"...", ...}, None if download failed
+        self.alias2bytes = {}
         # 图像标签
         self.label = ""
         self.prompt = ""
@@ -259,7 +277,7 @@ class HolyChallenger:
                 self.prompt = label_obj.text
                 if self.prompt:
                     break
-                time.sleep(1)
+                sleep(1)
                 continue
         # Skip the `draw challenge`
         else:
@@ -350,7 +368,7 @@ class HolyChallenger:
                 except TimeoutException:
                     return self.CHALLENGE_CONTINUE
 
-        time.sleep(0.3)
+        sleep(0.3)
 
         # DOM 定位元素
         samples = ctx.find_elements(By.XPATH, "//div[@class='task-image']")
@@ -366,7 +384,7 @@ class HolyChallenger:
                     continue
             self.alias2locator.update({alias: sample})
 
-    def download_images(self):
+    def download_images(self, timeout: float = DOWNLOAD_TIMEOUT) -> typing.Dict[str, typing.Optional[bytes]]:
         """
         Download Challenge Image
 
@@ -378,42 +396,49 @@ class HolyChallenger:
 
         ### Solution
 
-        1. Coroutine Downloader
-          Use the coroutine-based method to _pull the image to the local, the best practice (this method).
-          In the case of poor network, _pull efficiency is at least 10 times faster than traversal download.
+        1. Concurrent Downloader
+          All images are pulled in parallel over a pooled session straight into memory (this method),
+          nothing is written to the workspace.
 
         2. Screen cut
-          There is some difficulty in coding.
-          Directly intercept nine pictures of the target area, and use the tool function to cut and identify them.
-          Need to weave the locator index yourself.
+          Used per image by `get_images_as_base64` only when its download failed.
 
-        :return:
+        :param timeout: per image timeout in seconds
+        :return: {alias: bytes or None}
         """
 
-        # Initialize the challenge image download directory
-        self.runtime_workspace = self._init_workspace()
-
-        # Initialize the data container
-        docker_ = []
-        for alias_, url_ in self.alias2url.items():
-            path_challenge_img_ = os.path.join(self.runtime_workspace, f"{alias_}.png")
-            self.alias2path.update({alias_: path_challenge_img_})
-            docker_.append((path_challenge_img_, url_))
-
-        for url, path in zip(self.alias2url.values(), self.alias2path.values()):
-            with open(path, 'wb') as f:
-                f.write(requests.get(url).content)
+        futures = {alias: _downloader.submit(_fetch_image, url, timeout) for alias, url in self.alias2url.items()}
+        wait(futures.values(), timeout=timeout)
+
+        self.alias2bytes = {}
+        for alias, future in futures.items():
+            if not future.done():
+                future.cancel()
+                self.log("Image download timeout", alias=alias)
+                self.alias2bytes[alias] = None
+            elif future.exception() is not None:
+                self.log("Image download failed", alias=alias, err=future.exception())
+                self.alias2bytes[alias] = None
+            else:
+                self.alias2bytes[alias] = future.result()
+        return self.alias2bytes
 
     def get_images_as_base64(self):
         if self.image_getting_method == 'screenshot':
             try:
-                imgs = [loc.screenshot_as_base64 for loc in self.alias2locator.values()]
+                return [loc.screenshot_as_base64 for loc in self.alias2locator.values()]
             except ElementClickInterceptedException:
-                self.download_images()
-                imgs = [path_to_base64(self.alias2path[alias], encoding='ascii') for alias in self.alias2path]
-        else:
-            self.download_images()
-            imgs = [path_to_base64(self.alias2path[alias], encoding='ascii') for alias in self.alias2path]
+                pass
+
+        self.download_images()
+        imgs = []
+        for alias, loc in self.alias2locator.items():
+            content = self.alias2bytes.get(alias)
+            if content is None:
+                # Fallback only for the images that could not be fetched
+                imgs.append(loc.screenshot_as_base64)
+            else:
+                imgs.append(base64.b64encode(content).decode('ascii'))
         return imgs
 
     def challenge(self, ctx):
@@ -438,7 +463,7 @@ class HolyChallenger:
         # {{< IMAGE CLASSIFICATION >}}
         imgs = self.get_images_as_base64()
         data = {'type': 'hcaptcha', 'images': imgs, 'prompt': self.prompt}
-        response = requests.post(f'{self.HOST}/resolve', json=data)
+        response = self.HOST.post(data)
         results = response.json()['response']
 
         # Pass: Hit at least one object
@@ -448,7 +473,7 @@ class HolyChallenger:
             for result, alias in mapped_result:
                 if result:
                     try:
-                        time.sleep(random.uniform(0.1, 1.0))
+                        sleep(random.uniform(0.1, 1.0))
                         elm = self.alias2locator[alias]
                         ctx.execute_script("arguments[0].click()", elm)
                     except StaleElementReferenceException:
@@ -456,7 +481,7 @@ class HolyChallenger:
                     except WebDriverException as err:
                         logger.warning(err)
 
-        time.sleep(random.uniform(1.0, 2.0))
+        sleep(random.uniform(1.0, 2.0))
         # {{< SUBMIT ANSWER >}}
         try:
             elm = WebDriverWait(ctx, 15, ignored_exceptions=(ElementClickInterceptedException,)).until(
@@ -510,7 +535,7 @@ class HolyChallenger:
             except TimeoutException:
                 return False
 
-        time.sleep(1)
+        sleep(1)
         if not callable(self.next_locator):
             if multiWaitNsec(ctx, [is_flagged_flow, is_challenge_image_clickable, self.next_locator], 3, 30) == 2:
                 return self.CHALLENGE_SUCCESS, '_'
@@ -597,7 +622,6 @@ class HolyChallenger:
                 self.log("Get response", desc=result)
 
                 ctx.switch_to.default_content()
-                shutil.rmtree(self.runtime_workspace, ignore_errors=True)
 
                 if result in [self.CHALLENGE_SUCCESS, self.CHALLENGE_CRASH, self.CHALLENGE_RETRY]:
                     return result
@@ -1,14 +1,108 @@
 import logging
 import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
 import requests
 
 from ..common import *
 from ..exceptions import InvalidImageGettingMethodException, MaxRetryExceededException
+from ..frames import FrameProbe
+from ..resolver import ResolverClient
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['RecaptchaUtils', 'Selenium', 'safe_request', 'By', 'NoSuchElementException']
+__all__ = ['RecaptchaUtils', 'Selenium', 'safe_request', 'By', 'NoSuchElementException', 'CONTINUE', 'RETRY']
+
+# Outcomes of a round other than solved (True) or failed (False): play the next challenge, or a new one once reloaded
+CONTINUE = 'continue'
+RETRY = 'retry'
+ROUND_STAGES = ('capture', 'resolve', 'mark', 'verify', 'wait')
+
+# Resolves with the xpaths of the tiles showing a new image (src not in old srcs) fully loaded and decoded, as soon as
+# `need` of them are, or with the ones decoded so far after timeout seconds
+# arguments: xpaths, old srcs, timeout, need, callback
+TILES_DECODED_SCRIPT = '''
+const [xpaths, oldSrcs, timeout, need, done] = arguments;
+const find = xpath => document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const decoded = {}, pending = {};
+let finished = false, timer = null, observer = null;
+
+const ready = () => xpaths.filter(xpath => {
+    const img = find(xpath);
+    return img && decoded[xpath] === img.src;
+});
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    done(ready());
+};
+const check = () => {
+    for (const xpath of xpaths) {
+        const img = find(xpath);
+        if (!img || !img.src || oldSrcs.includes(img.src) || decoded[xpath] === img.src || pending[xpath] === img.src) {
+            continue;
+        }
+        const src = pending[xpath] = img.src;
+        img.decode().then(() => {
+            decoded[xpath] = src;
+            check();
+        }, () => {
+            // decode fails while the image is still loading or once src changed again, retry on next load
+            delete pending[xpath];
+            img.addEventListener('load', check, {once: true});
+        });
+    }
+    if (ready().length >= need) finish();
+};
+
+observer = new MutationObserver(check);
+observer.observe(document.body, {subtree: true, childList: true, attributes: true, attributeFilter: ['src']});
+timer = setTimeout(finish, timeout * 1000);
+check();
+'''
+
+# Tiles of the challenge with their element, src, rect and selected state
+# arguments: xpaths of the tiles, every tile of the grid if null
+TILES_SNAPSHOT_SCRIPT = '''
+const find = xpath => document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+let xpaths = arguments[0];
+if (!xpaths) {
+    const n = document.querySelectorAll('div[class="rc-imageselect-checkbox"]').length;
+    xpaths = Array.from({length: n}, (_, i) => `//td[@tabindex="${i + 4}"]/div/div/img`);
+}
+return xpaths.map(xpath => {
+    const img = find(xpath);
+    const td = img && img.closest('td');
+    const rect = img && img.getBoundingClientRect();
+    return {
+        xpath: xpath,
+        element: img,
+        src: img ? img.src : null,
+        rect: rect ? {x: rect.x, y: rect.y, width: rect.width, height: rect.height} : null,
+        selected: Boolean(td && td.classList.contains('rc-imageselect-tileselected'))
+    };
+});
+'''
+
+# Click elements one after the other waiting a random delay between min and max seconds after each click
+# arguments: elements, min, max, callback; resolves with the src of every element before its click
+CLICK_BATCH_SCRIPT = '''
+const [elements, min, max, done] = arguments;
+const srcs = [];
+let i = 0;
+const next = () => {
+    if (i === elements.length) return done(srcs);
+    const element = elements[i++];
+    srcs.push(element.getAttribute('src'));
+    element.click();
+    setTimeout(next, (min + Math.random() * (max - min)) * 1000);
+};
+next();
+'''
 
 
 class RecaptchaUtils(Selenium):
@@ -17,19 +111,23 @@ class RecaptchaUtils(Selenium):
                  callback_module, callback_at, response_locator, *args, **kwargs):
         """
         Recaptcha solving
-        :param host: Captcha solver server complete address like http://127.0.0.1:5000
+        :param host: Captcha solver server complete address like http://127.0.0.1:5000 or ResolverClient
         :param driver: WebDriver object
         :param wait: WebDriverWait object
         :param hook_frames: list of hook frames
         :param challenge_frames: list of challenge frames
-        :param storage: storage path
+        :param storage: temporary storage, MemoryStorage or DirectoryStorage
         :param image_getting_method: screenshot or request
         :param next_locator: possible next locator, useful in solving invisible captcha
         :param callback_module: use your own callback module, like 2captcha
         :param callback_at: when to use callback, like after 5 retries
+        :param stream_tiles: (kwarg) resolve every replaced tile as soon as it is decoded instead of waiting for all of
+            them, True by default
+        :param max_rounds: (kwarg) max challenge rounds before giving up, 15 by default
+        :param time_budget: (kwarg) max seconds spent in rounds before giving up, 300 by default, no limit if None
         """
 
-        self.HOST = host
+        self.HOST = ResolverClient.of(host)
         self.driver = driver
         self.wait = wait
         self.timeout = timeout
@@ -51,13 +149,22 @@ class RecaptchaUtils(Selenium):
         # Additional modules
         self.callback_module = callback_module
 
+        self.stream_tiles = kwargs.pop('stream_tiles', True)
+        self.max_rounds = kwargs.pop('max_rounds', 15)
+        self.time_budget = kwargs.pop('time_budget', 300)
+        self.rounds = []
+        self.round = None
         self.args = args
         self.kwargs = kwargs
         super().__init__(self.driver, self.wait, self.timeout)
+        # Predicates below read one status record of every frame instead of switching to each of them
+        self.probe = FrameProbe(self.driver, lambda: ([self.HOOK_FRAME], self.CHALLENGE_FRAMES))
 
     def anti_checkbox(self):
         """ Click checkbox and return True else False """
 
+        if not self.probe.status()['checkbox']:
+            return False
         self.driver.switch_to.frame(self.HOOK_FRAME)
         try:
             checkbox = self.driver.find_element(By.XPATH, '//*[@id="rc-anchor-container"]')
@@ -72,42 +179,72 @@ class RecaptchaUtils(Selenium):
 
     def recaptcha_response(self) -> bool:
         """Check whether recaptcha solved or not"""
+        if self.response_locator is None:
+            return self.probe.status()['response']
         try:
-            if self.response_locator is not None:
-                return self.driver.find_element(*self.response_locator).get_attribute('value') != ''
-            for elem in self.driver.find_elements(By.XPATH, '//*[@name="g-recaptcha-response"]'):
-                if elem.get_attribute('value'):
-                    return True
-            return False
+            return self.driver.find_element(*self.response_locator).get_attribute('value') != ''
         except Selenium.__exceptions__:
             return False
 
-    def _is_banner_visible(self, _frame):
-        """Check if label banner visible on given frame"""
+    def is_banner_visible(self):
+        """Check if label banner visible on any frame"""
 
-        self.driver.switch_to.frame(_frame)
-        try:
-            self.driver.find_element(By.XPATH, '//strong')
-        except Selenium.__exceptions__:
-            try:
-                self.driver.find_element(By.ID, 'audio-instructions')
-            except Selenium.__exceptions__:
-                return False
-            else:
-                return True
-        else:
+        if self.probe.status()['banner']:
+            logger.debug("Label banner is visible")
             return True
+        return False
+
+    @contextmanager
+    def timed(self, stage):
+        """ Add the time spent in the block to stage of the current round """
+        start = time.monotonic()
+        try:
+            yield
         finally:
-            self.driver.switch_to.parent_frame()
+            if self.round is not None:
+                self.round[stage] += time.monotonic() - start
 
-    def is_banner_visible(self):
-        """Check if label banner visible on any frame"""
+    def resolve(self, data) -> requests.Response:
+        """ Post data to the resolver """
+        with self.timed('resolve'):
+            return self.HOST.post(data)
 
-        for f in self.CHALLENGE_FRAMES:
-            if self._is_banner_visible(f):
-                logger.debug("Label banner is visible")
-                return True
-        return False
+    def wait_status(self, predicates):
+        """ Index of the first true predicate reading the frame status record """
+        with self.timed('wait'):
+            return self.probe.wait(predicates, self.timeout)
+
+    def run_rounds(self) -> bool:
+        """
+        Play _solve rounds until one of them solves or fails the challenge, within max_rounds and time_budget
+        Every round is recorded in self.rounds with the seconds spent in each stage::
+            {'round': 1, 'grid': '3x3', 'outcome': 'continue', 'capture': 0.4, 'resolve': 1.2, 'mark': 1.9,
+             'verify': 0.1, 'wait': 3.2, 'total': 7.0}
+        """
+
+        self.rounds = []
+        start = time.monotonic()
+        outcome = CONTINUE
+        while outcome in (CONTINUE, RETRY):
+            if len(self.rounds) >= self.max_rounds:
+                logger.debug(f"Max rounds reached: {self.max_rounds}")
+                return False
+            if self.time_budget is not None and time.monotonic() - start > self.time_budget:
+                logger.debug(f"Time budget exceeded: {self.time_budget}s")
+                return False
+
+            self.round = dict({'round': len(self.rounds) + 1, 'grid': None}, **{stage: 0.0 for stage in ROUND_STAGES})
+            round_start = time.monotonic()
+            outcome = 'error'
+            try:
+                outcome = self._solve()
+            finally:
+                self.round['outcome'] = {True: 'solved', False: 'failed', None: 'failed'}.get(outcome, outcome)
+                self.round['total'] = time.monotonic() - round_start
+                logger.debug(f"Round: {self.round}")
+                self.rounds.append(self.round)
+                self.round = None
+        return bool(outcome)
 
     def reload_captcha(self) -> None:
         """Just press the retry button"""
@@ -117,7 +254,8 @@ class RecaptchaUtils(Selenium):
     def verify_captcha(self) -> None:
         """Just press the verify button"""
         logger.debug("Verifying captcha...")
-        self.click_js((By.ID, 'recaptcha-verify-button'))
+        with self.timed('verify'):
+            self.click_js((By.ID, 'recaptcha-verify-button'))
 
     def callback_solving(self):
         """Feature to use any callbacks like 2captcha, nopecha, etc"""
@@ -130,12 +268,16 @@ class RecaptchaUtils(Selenium):
         logger.debug("[CallBacks] Token injected!")
 
     def retry_challenge(self):
-        """Switch to parent frame and retry challenge"""
+        """
+        Reload challenge and switch to parent frame
+        :return: RETRY to play the new challenge or True if solved by the callback module
+        """
 
         logger.debug(f"Retrying...")
         self.reload_captcha()
         self.driver.switch_to.parent_frame()
-        self.delay.custom(3)
+        with self.timed('wait'):
+            self.delay.custom(3)
 
         # Back calls implementation
         if self.callback_at is not None:
@@ -146,27 +288,24 @@ class RecaptchaUtils(Selenium):
                 self.callback_solving()
                 return True
 
-        return self._solve()
+        return RETRY
 
     def is_retry_prompt(self) -> bool:
         """Check if any retry prompt is visible"""
 
-        self.driver.switch_to.frame(self.CHALLENGE_FRAME)
-        try:
-            elms = [x.is_displayed() for x in
-                    self.driver.find_elements(By.XPATH, '//*[contains(text(), "Please")]')]
-        except (NoSuchElementException, StaleElementReferenceException):
-            pass
-        else:
+        if self.probe.frame(self.CHALLENGE_FRAME).get('retry_prompt'):
             logger.debug("Retry prompt found")
-            return bool(True in elms)
-        finally:
-            self.driver.switch_to.parent_frame()
+            return True
+        return False
 
     def wait_till_new_images(self, xpaths, srcs):
         """Dynamically wait until new images load"""
 
         logger.debug("Waiting until new images load")
+        with self.timed('wait'):
+            return self._wait_till_new_images(xpaths, srcs)
+
+    def _wait_till_new_images(self, xpaths, srcs):
         for _ in range(100):
             try:
                 if not [1 for xpath in xpaths if self.driver.find_element(By.XPATH, xpath).get_attribute('src') in srcs]:
@@ -177,21 +316,97 @@ class RecaptchaUtils(Selenium):
             self.delay.custom(0.1)
         return False
 
+    def snapshot_tiles(self, xpaths=None):
+        """
+        Every tile in one round trip
+        :param xpaths: xpaths of the tiles, every tile of the grid if None
+        :return: [{'xpath', 'element', 'src', 'rect': {'x', 'y', 'width', 'height'}, 'selected'}, ...]
+        """
+
+        return self.driver.execute_script(TILES_SNAPSHOT_SCRIPT, xpaths)
+
+    def click_batch(self, elements, spacing=(0.1, 1)):
+        """
+        Click elements in one round trip, spaced like delay.one10_one
+        :param spacing: min and max seconds waited after each click
+        :return: src of every element before its click
+        """
+
+        if not elements:
+            return []
+        with self.timed('mark'):
+            return self.driver.execute_async_script(CLICK_BATCH_SCRIPT, elements, *spacing)
+
+    def wait_tiles_decoded(self, xpaths, srcs, timeout=10, need=None):
+        """
+        Wait in the page until tiles at xpaths show new images (src not in srcs) fully loaded and decoded
+        :param need: return as soon as this many tiles are decoded, all of them if None
+        :return: xpaths of the decoded tiles, fewer than needed if timeout is reached
+        """
+
+        need = len(xpaths) if need is None else need
+        try:
+            with self.timed('wait'):
+                decoded = self.driver.execute_async_script(TILES_DECODED_SCRIPT, xpaths, srcs, timeout, need)
+        except (JavascriptException, TimeoutException) as e:
+            logger.debug(f"Tiles readiness script failed: {e}")
+            return []
+        logger.debug(f"{len(decoded)}/{len(xpaths)} new images decoded")
+        return decoded
+
+    def stream_new_tiles(self, label, xpaths, srcs, timeout=10):
+        """
+        Pipelined replacement round, every tile is captured and sent to the resolver as soon as its new image is
+        decoded and clicked as soon as its answer arrives, so that resolving overlaps with loading of slower tiles
+        :return: {xpath: src} of the tiles clicked, they are replaced again
+        """
+
+        waiting, futures, clicked = list(xpaths), {}, {}
+        deadline = time.monotonic() + timeout
+        with ThreadPoolExecutor(max_workers=len(xpaths)) as executor:
+            while waiting or futures:
+                if waiting:
+                    remaining = deadline - time.monotonic()
+                    # Only poll for new tiles while answers are pending so that they are clicked without delay
+                    decoded = self.wait_tiles_decoded(waiting, srcs, min(0.5, remaining) if futures else remaining, 1)
+                    if not decoded and remaining <= 0:
+                        logger.debug(f"{len(waiting)} tiles not decoded after {timeout}s, capturing them as they are")
+                        decoded = list(waiting)
+                    for xpath in decoded:
+                        waiting.remove(xpath)
+                        element = self.driver.find_element(By.XPATH, xpath)
+                        data = {'type': 'recaptcha', 'images': [self.get_image_as_base64(element, self.retry_challenge)],
+                                'grid': '1x1', 'label': label}
+                        futures[executor.submit(self.HOST.post, data)] = (xpath, element)
+
+                if waiting:
+                    done = [f for f in futures if f.done()]
+                else:
+                    with self.timed('resolve'):
+                        done = wait(futures, return_when=FIRST_COMPLETED).done
+                for future in done:
+                    xpath, element = futures.pop(future)
+                    res = future.result().json()['response']
+                    if res and res[0]:
+                        clicked[xpath] = self.click_batch([element])[0]
+                        logger.debug(f"Marked new tile {xpath}")
+
+        return clicked
+
     def get_image_as_base64(self, image_element, callback):
         """Get image as base64 format"""
+        with self.timed('capture'):
+            return self._get_image_as_base64(image_element, callback)
 
+    def _get_image_as_base64(self, image_element, callback):
         logger.debug("Getting image in base64 format")
         if self.image_getting_method == 'request':
-            img_path = f"{self.storage}/img.png"
-            safe_request(image_element.get_attribute('src'), None, ConnectionError, on_error=callback, image_path=img_path)
-            img_as_base64 = path_to_base64(img_path, encoding='ascii')
+            img_as_base64 = self.download_image_as_base64(image_element, callback)
         elif self.image_getting_method == 'screenshot':
             try:
                 img_as_base64 = image_element.screenshot_as_base64
             except ElementClickInterceptedException:
-                img_path = f"{self.storage}/img.png"
-                safe_request(image_element.get_attribute('src'), None, ConnectionError, on_error=callback, image_path=img_path)
-                img_as_base64 = path_to_base64(img_path, encoding='ascii')
+                img_as_base64 = self.download_image_as_base64(image_element, callback)
         else:
             raise InvalidImageGettingMethodException(f"Unknown method {self.image_getting_method}\n"
                                                      " choose `request` or `screenshot`")
@@ -199,6 +414,13 @@ class RecaptchaUtils(Selenium):
         logger.debug("Success getting image in base64 format")
         return img_as_base64
 
+    def download_image_as_base64(self, image_element, callback):
+        """Download image src through temporary storage and read it as base64"""
+
+        safe_request(image_element.get_attribute('src'), None, ConnectionError, on_error=callback, image_path='img.png',
+                     storage=self.storage)
+        return self.storage.read_base64('img.png', encoding='ascii')
+
     def mark_images(self, response: requests.Response, image_wrappers, callback):
         """Mark images and update return their sources"""
 
@@ -209,14 +431,10 @@ class RecaptchaUtils(Selenium):
 
         idx = [i for i, x in enumerate(res) if x]
         random.shuffle(idx)
-        old_srcs = []
+        old_srcs = self.click_batch([image_wrappers[f'wrapper-{i}']['element'] for i in idx])
         for i in idx:
-            wrapper = image_wrappers[f'wrapper-{i}']['element']
-            old_srcs.append(wrapper.get_attribute('src'))
-            self.click_js(wrapper)
             image_wrappers[f'wrapper-{i}']['marked'] = True
-            self.delay.one10_one()
-            logger.debug(f"Marked {i}th image")
+        logger.debug(f"Marked images {idx}")
 
         return old_srcs
 
@@ -227,15 +445,12 @@ class RecaptchaUtils(Selenium):
         if not res or True not in res:
             return True
 
-        old_srcs = []
+        keys = list(image_wrappers.keys())
         idx = indexN(res, True, 3)
         random.shuffle(idx)
+        old_srcs = self.click_batch([image_wrappers[keys[i]]['element'] for i in idx])
         for i in idx:
-            wrapper = image_wrappers[list(image_wrappers.keys())[i]]['element']
-            old_srcs.append(wrapper.get_attribute('src'))
-            self.click_js(wrapper)
-            image_wrappers[list(image_wrappers.keys())[i]]['marked'] = True
-            self.delay.one10_one()
+            image_wrappers[keys[i]]['marked'] = True
 
         return old_srcs
 
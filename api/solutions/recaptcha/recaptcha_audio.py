@@ -1,7 +1,5 @@
 import logging
 
-import requests
-
 from .common import *
 
 logger = logging.getLogger(__name__)
@@ -27,21 +25,13 @@ class RecaptchaAudio(RecaptchaUtils):
             self.driver.switch_to.parent_frame()
 
     def retry_prompt(self):
-        self.driver.switch_to.frame(self.CHALLENGE_FRAME)
-        try:
-            elms = [x.is_displayed() for x in
-                    self.driver.find_elements(By.XPATH, '//*[contains(text(), "Please")]')]
-        except NoSuchElementException:
-            pass
-        else:
-            return bool(True in elms)
-        finally:
-            self.driver.switch_to.parent_frame()
+        return self.is_retry_prompt()
 
-    def _solve(self) -> bool:
+    def _solve(self):
         """
-        Use speech recognition to solve recaptcha
+        Play one round, use speech recognition to solve recaptcha
         This method is now deprecated because recaptcha easily classify chromedriver as bot using this
+        :return: True if solved, False if failed, CONTINUE to play another round
         """
 
         self.driver.switch_to.frame(self.CHALLENGE_FRAME)
@@ -53,32 +43,36 @@ class RecaptchaAudio(RecaptchaUtils):
         src = self.driver.find_element(By.ID, "audio-source").get_attribute("src")
         # Your server here that handle audio
         data = {'type': 'recaptcha-audio', 'src': src}
-        response = requests.post(f'{self.HOST}/resolve', json=data)
+        response = self.resolve(data)
         result = response.json()['response']
 
         # Bad request response here
         if result is not None:
             self.reload_captcha()
             self.driver.switch_to.parent_frame()
-            self.delay.custom(5)
-            return self._solve()
+            with self.timed('wait'):
+                self.delay.custom(5)
+            return CONTINUE
 
         audio_elm = self.driver.find_element(By.ID, "audio-response")
         audio_elm.send_keys(result.lower())
         self.verify_captcha()
         self.driver.switch_to.parent_frame()
-        self.delay.custom(2)
+        with self.timed('wait'):
+            self.delay.custom(2)
 
-        if self.multiWait([self.multiple_correct_prompt, self.retry_prompt, self.recaptcha_response]) != 2:
-            return self._solve()
+        if self.wait_status([self.multiple_correct_prompt, self.retry_prompt, self.recaptcha_response]) != 2:
+            return CONTINUE
         return True
 
     def solve(self):
         self.real_hook_frame()
         logger.debug("Challenge handling")
-        response_id = self.multiWait([self.anti_checkbox, self.is_banner_visible, self.recaptcha_response, self.next_locator])
+        response_id = self.wait_status([self.anti_checkbox, self.is_banner_visible, self.recaptcha_response,
+                                        self.next_locator])
         if response_id == 0:
-            response_id = self.multiWait([lambda: 1 == 2, self.is_banner_visible, self.recaptcha_response, self.next_locator])
+            response_id = self.wait_status([lambda: 1 == 2, self.is_banner_visible, self.recaptcha_response,
+                                            self.next_locator])
         if response_id == 1:
             self.real_challenge_frame()
             self.driver.switch_to.frame(self.CHALLENGE_FRAME[1])
@@ -88,7 +82,7 @@ class RecaptchaAudio(RecaptchaUtils):
                 self.click_js(audio_btn)
                 self.delay.one_3()
             self.driver.switch_to.parent_frame()
-            return self._solve()
+            return self.run_rounds()
         else:
             response = True
 
@@ -1,8 +1,6 @@
 import logging
 import random
 
-import requests
-
 from .common import *
 
 logger = logging.getLogger(__name__)
@@ -13,8 +11,11 @@ logger.addHandler(stream_handler)
 
 
 class RecaptchaV2(RecaptchaUtils):
-    def _solve(self) -> bool:
-        """Use ml models to classify image and solve recaptcha gracefully"""
+    def _solve(self):
+        """
+        Play one round, use ml models to classify image and solve recaptcha gracefully
+        :return: True if solved, False if failed, CONTINUE or RETRY to play another round
+        """
 
         # Enter frame
         logger.debug("Switching to challenge frame")
@@ -24,25 +25,23 @@ class RecaptchaV2(RecaptchaUtils):
         logger.debug(f"Label found - {label}")
 
         # __init__ image | use either screenshot method or src method
-        image_wrappers = {}
-        for i in range(len(self.driver.find_elements(By.XPATH, '//div[@class="rc-imageselect-checkbox"]'))):
-            image_wrappers[f'wrapper-{i}'] = {
-                'xpath': f'//td[@tabindex="{i + 4}"]/div/div/img',
-                'element': self.driver.find_element(By.XPATH, f'//td[@tabindex="{i + 4}"]/div/div/img'),
-                'marked': False
-            }
+        image_wrappers = {
+            f'wrapper-{i}': {'xpath': tile['xpath'], 'element': tile['element'], 'marked': False}
+            for i, tile in enumerate(self.snapshot_tiles())
+        }
 
         image_element = self.find_element(By.XPATH, '//img')
         logger.debug("Image element found")
         img = self.get_image_as_base64(image_element, callback=self.retry_challenge)
 
         if len(image_wrappers) == 9:
+            self.round['grid'] = '3x3'
             data = {'type': 'recaptcha', 'image': img, 'grid': '3x3', 'label': label}
             logger.debug("Resolving images...")
-            response = requests.post(f"{self.HOST}/resolve", json=data)
+            response = self.resolve(data)
             old_srcs = self.mark_images(response, image_wrappers, self.retry_challenge)
-            if isinstance(old_srcs, bool):
-                return True
+            if not isinstance(old_srcs, list):
+                return old_srcs
 
             # Check if new tiles appear, solve them otherwise verify captcha
             # We generally use 5 iters to check if new tiles come, if new tiles come in the sixth time, the solver
@@ -52,23 +51,34 @@ class RecaptchaV2(RecaptchaUtils):
             if self.driver.execute_script(script):
                 new_tiles_limit = 10
                 for t in range(new_tiles_limit):
-                    self.wait_till_new_images([v['xpath'] for k, v in image_wrappers.items() if v['marked']], old_srcs)
-                    self.delay.custom(2)    # explicit wait to ensure new images loaded
-                    image_wrappers = {
-                        k: {'xpath': v['xpath'], 'element': self.driver.find_element(By.XPATH, v['xpath']),
-                            'marked': False} for k, v in image_wrappers.items() if v['marked']
-                    }
-                    imgs = []
-                    for k, v in image_wrappers.items():
-                        img = self.get_image_as_base64(v['element'], self.retry_challenge)
-                        imgs.append(img)
-
-                    data = {'type': 'recaptcha', 'images': imgs, 'grid': '1x1', 'label': label}
-                    logger.debug("Resolving images...")
-                    response = requests.post(f"{self.HOST}/resolve", json=data)
-                    old_srcs = self.mark_new_images(response, image_wrappers)
-                    if isinstance(old_srcs, bool):
-                        break
+                    xpaths = [v['xpath'] for k, v in image_wrappers.items() if v['marked']]
+                    if self.stream_tiles:
+                        clicked = self.stream_new_tiles(label, xpaths, old_srcs)
+                        if not clicked:
+                            break
+                        image_wrappers = {k: v for k, v in image_wrappers.items() if v['xpath'] in clicked}
+                        old_srcs = list(clicked.values())
+                    else:
+                        if len(self.wait_tiles_decoded(xpaths, old_srcs)) < len(xpaths):
+                            self.wait_till_new_images(xpaths, old_srcs)
+                            with self.timed('wait'):
+                                self.delay.custom(2)    # explicit wait to ensure new images loaded
+                        image_wrappers = {
+                            k: {'xpath': tile['xpath'], 'element': tile['element'], 'marked': False}
+                            for k, tile in zip([k for k, v in image_wrappers.items() if v['marked']],
+                                               self.snapshot_tiles(xpaths))
+                        }
+                        imgs = []
+                        for k, v in image_wrappers.items():
+                            img = self.get_image_as_base64(v['element'], self.retry_challenge)
+                            imgs.append(img)
+
+                        data = {'type': 'recaptcha', 'images': imgs, 'grid': '1x1', 'label': label}
+                        logger.debug("Resolving images...")
+                        response = self.resolve(data)
+                        old_srcs = self.mark_new_images(response, image_wrappers)
+                        if isinstance(old_srcs, bool):
+                            break
 
                     # If limit reached retry challenge
                     if t == new_tiles_limit - 1:
@@ -85,30 +95,28 @@ class RecaptchaV2(RecaptchaUtils):
 
             # Process response: on_error -> retry | on_success -> exit
             logger.debug("Checking challenge response")
-            if self.multiWait([self.is_retry_prompt, self.recaptcha_response, self.next_locator]) == 0:
+            if self.wait_status([self.is_retry_prompt, self.recaptcha_response, self.next_locator]) == 0:
                 logger.debug("Challenge continue")
-                return self._solve()
+                return CONTINUE
 
             logger.debug("!!! Challenge successfully passed !!!")
             return True
 
         elif len(image_wrappers) == 16:
+            self.round['grid'] = '4x4'
             data = {'type': 'recaptcha', 'image': img, 'grid': '4x4', 'label': label}
             logger.debug("Resolving images...")
-            response = requests.post(f"{self.HOST}/resolve", json=data)
+            response = self.resolve(data)
             res = response.json()['response']
             if not res or True not in res:
                 logger.debug("Bad response.")
                 return self.retry_challenge()
 
             # Marking images
-            mapped_res = list(zip(range(16), res))
-            random.shuffle(mapped_res)
-            for i, x in mapped_res:
-                if x:
-                    self.click_js(image_wrappers[f'wrapper-{i}']['element'])
-                    logger.debug(f"Marked {i}th image")
-                    self.delay.one10_one()
+            idx = [i for i, x in enumerate(res[:16]) if x]
+            random.shuffle(idx)
+            self.click_batch([image_wrappers[f'wrapper-{i}']['element'] for i in idx])
+            logger.debug(f"Marked images {idx}")
 
             # Click verify button
             verify_btn = self.driver.find_element(By.ID, 'recaptcha-verify-button')
@@ -124,23 +132,30 @@ class RecaptchaV2(RecaptchaUtils):
 
             if verify_btn_text == 'NEXT' or verify_btn_text == 'SKIP':
                 logger.debug("Challenge continue")
-                self.delay.custom(3)  # small delay preventing detection
-                return self._solve()
+                with self.timed('wait'):
+                    self.delay.custom(3)  # small delay preventing detection
+                return CONTINUE
             else:
                 logger.debug("Checking challenge response")
-                if self.multiWait([self.is_retry_prompt, self.recaptcha_response, self.next_locator]) == 0:
+                if self.wait_status([self.is_retry_prompt, self.recaptcha_response, self.next_locator]) == 0:
                     logger.debug("Challenge continue")
-                    return self._solve()
+                    return CONTINUE
 
                 logger.debug("!!! Challenge successfully passed !!!")
                 return True
 
+        logger.debug(f"Unknown grid of {len(image_wrappers)} tiles")
+        self.driver.switch_to.parent_frame()
+        return False
+
     def solve(self):
         self.real_hook_frame()
         logger.debug("Challenge handling")
-        response_id = self.multiWait([self.anti_checkbox, self.is_banner_visible, self.recaptcha_response, self.next_locator])
+        response_id = self.wait_status([self.anti_checkbox, self.is_banner_visible, self.recaptcha_response,
+                                        self.next_locator])
         if response_id == 0:
-            response_id = self.multiWait([lambda: 1 == 2, self.is_banner_visible, self.recaptcha_response, self.next_locator])
+            response_id = self.wait_status([lambda: 1 == 2, self.is_banner_visible, self.recaptcha_response,
+                                            self.next_locator])
         if response_id == 1:
             self.real_challenge_frame()
             self.driver.switch_to.frame(self.CHALLENGE_FRAME)
@@ -150,7 +165,7 @@ class RecaptchaV2(RecaptchaUtils):
                 self.click_js(image_btn)
                 self.delay.one_3()
             self.driver.switch_to.parent_frame()
-            response = self._solve()
+            response = self.run_rounds()
         else:
             response = True
 
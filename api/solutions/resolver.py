@@ -0,0 +1,99 @@
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+BUDGET_HEADER = 'X-Resolver-Budget'
+
+
+class ShedResponse:
+    """Answer of a request the resolver did not answer in JSON, same status_code and json() as responses of /resolve"""
+
+    def __init__(self, payload, status_code=503):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class ResolverClient:
+    """
+    Client of the captcha resolver
+    Every request tells the resolver how long it has to answer (X-Resolver-Budget), requests it cannot answer in time
+    are answered at once with 503 and {'response': False, 'error': 'Overloaded' or 'Expired'}, 503 without JSON body
+    (i.e: from a proxy) are answered with {'response': False, 'error': 'Unavailable'}
+    """
+
+    def __init__(self, host, budget=None):
+        """
+        :param host: resolver address like http://127.0.0.1:5000
+        :param budget: seconds the resolver has to answer, no budget if None
+        """
+
+        self.host = host.rstrip('/')
+        self.budget = budget
+        self.session = requests.Session()
+
+    def __str__(self):
+        return self.host
+
+    def _request(self, budget):
+        budget = self.budget if budget is None else budget
+        headers = {BUDGET_HEADER: f"{budget:.3f}"} if budget else {}
+        return f"{self.host}/resolve", headers, budget + 5 if budget else None
+
+    @staticmethod
+    def _check(response):
+        if response.status_code == 503:
+            try:
+                error = response.json().get('error')
+            except ValueError:
+                # Plain text 503 of uvicorn --limit-concurrency or of a proxy in front of the resolver
+                logger.warning(f"[Resolver] Request shed with status {response.status_code} and no JSON body")
+                return ShedResponse({'response': False, 'error': 'Unavailable'}, response.status_code)
+            logger.warning(f"[Resolver] Request shed by resolver: {error}")
+        return response
+
+    def ready(self, timeout=2):
+        """ /ready payload of the resolver, {'ready': False} if it cannot be reached, ready is None while unknown """
+        try:
+            return self.session.get(f"{self.host}/ready", timeout=timeout).json()
+        except (requests.RequestException, ValueError):
+            return {'ready': False}
+
+    def post(self, data, budget=None) -> requests.Response:
+        """
+        Post data to /resolve
+        :param budget: overrides budget of the client
+        """
+
+        return self._post(data, budget)
+
+    def _post(self, data, budget=None):
+        url, headers, timeout = self._request(budget)
+        return self._check(self.session.post(url, json=data, headers=headers, timeout=timeout))
+
+    @classmethod
+    def of(cls, host, budget=None):
+        """
+        Client of host which is either a client, an address, inproc:// for the resolver embedded in this process or
+        several of them as a list or a comma separated string, requests are then balanced over them by the balancer
+        of these hosts shared by every client of the process
+        :param budget: budget of the client created
+        """
+
+        if isinstance(host, ResolverClient):
+            return host
+        hosts = [h.strip() for h in host.split(',')] if isinstance(host, str) else list(host)
+        if len(hosts) > 1:
+            from .balancer import BalancedResolver, BudgetedResolver
+            return BudgetedResolver(BalancedResolver.shared(hosts), budget)
+        host = hosts[0]
+        if isinstance(host, ResolverClient):
+            return host
+        if host.startswith('inproc://'):
+            from .embedded import EmbeddedResolver
+            return EmbeddedResolver(host, budget)
+        return cls(host, budget)
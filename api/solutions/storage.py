@@ -0,0 +1,79 @@
+import base64
+import os
+import shutil
+import urllib.request
+
+__all__ = ['MemoryStorage', 'DirectoryStorage']
+
+
+class MemoryStorage:
+    """
+    Temporary storage for captcha content, files are kept as bytes keyed by name
+    This is the default storage of CaptchaSolver, a solve never touches the disk with it
+    """
+
+    # No directory is backing this storage
+    directory = None
+
+    def __init__(self):
+        self._files = {}
+
+    def write(self, name, content: bytes):
+        """ Save content under given name """
+        self._files[name] = content
+
+    def read(self, name) -> bytes:
+        """ Read content saved under given name """
+        return self._files[name]
+
+    def exists(self, name) -> bool:
+        """ Is anything saved under given name """
+        return name in self._files
+
+    def read_base64(self, name, encoding="bytes"):
+        """ Read content saved under given name as base64 string """
+        b64 = base64.b64encode(self.read(name))
+        if encoding == 'ascii':
+            b64 = b64.decode('ascii')
+        return b64
+
+    def retrieve(self, url, name):
+        """ Same as urllib.request.urlretrieve but save the content in this storage, data urls are supported as well """
+        with urllib.request.urlopen(url) as response:
+            self.write(name, response.read())
+
+    def destroy(self):
+        """ Forget all saved content """
+        self._files.clear()
+
+
+class DirectoryStorage(MemoryStorage):
+    """
+    Temporary storage for captcha content backed by a directory, useful for debugging as the images can be inspected
+    The storage can be used in place of its path i.e: f"{storage}/img.png" or os.path.join(storage, 'img.png')
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(self.directory)
+
+    def __str__(self):
+        return self.directory
+
+    def __fspath__(self):
+        return self.directory
+
+    def write(self, name, content: bytes):
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(content)
+
+    def read(self, name) -> bytes:
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def exists(self, name) -> bool:
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def destroy(self):
+        shutil.rmtree(self.directory, ignore_errors=True)